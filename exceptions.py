@@ -1,3 +1,11 @@
 
 class LinksNotFound(Exception):
     pass
+
+
+class SearchThrottled(Exception):
+    pass
+
+
+class TimeBudgetExceeded(Exception):
+    pass
@@ -7,16 +7,20 @@ from django.core.files import File
 from django.core.files.temp import NamedTemporaryFile
 
 from web.kwfinder import models
+from web.kwfinder.services.link_extractors import package_id_from_link
 from web.kwfinder.services.telegram.telegram_bot import TelegramBot
 
 logger = logging.getLogger(__name__)
 
 
-def check_app(app: models.App, session: requests.Session):
+def check_app(app: models.App, session: requests.Session) -> bool:
     """ Checks app state (banned / or not banned) and updates its icon
 
     Args:
         app (App): app to check
+
+    Returns:
+        bool: False if app page request failed
     """
     logger.info(f"Checking app {app.name}_{app.num}.")
 
@@ -25,7 +29,7 @@ def check_app(app: models.App, session: requests.Session):
     except Exception as e:
         logger.exception(e)
         logger.warning("Failed to check app's state!")
-        return
+        return False
 
     if r.status_code == 404:
         logger.info(f"App {app.name}_{app.num} is most likely banned!")
@@ -36,12 +40,18 @@ def check_app(app: models.App, session: requests.Session):
                 parse_mode='MarkdownV2')
         app.is_active = False
         app.save()
-        return
+        return True
+
+    if package_id_from_link(str(r.url)) != app.package_id:
+        logger.warning(
+            f"App {app.name}_{app.num} page is redirected to {r.url}. Skipping icon update.")
+        return True
 
     parsed_html = BeautifulSoup(r.text, features="html.parser")
     img = parsed_html.find('img', class_='T75of nm4vBd arM4bb')
 
     __update_icon(app=app, img=img, session=session)
+    return True
 
 
 def __update_icon(app: models.App, img, session: requests.Session):
@@ -6,6 +6,7 @@ from typing import Any
 
 from web.kwfinder import models
 from web.kwfinder.controllers.asoworldAPI import ASOWorldAPIController
+from web.kwfinder.services import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -200,9 +201,11 @@ def update_orders():
 
         if not order:
             __create_order(data=order_data)
+            metrics.JOB_ITEMS.inc(job="update_orders", result="created")
             continue
 
         __update_order(order=order, data=order_data)
+        metrics.JOB_ITEMS.inc(job="update_orders", result="updated")
 
 
 def __update_order(order: models.ASOWorldOrder, data: dict[str, Any]):
@@ -1,17 +1,30 @@
-from time import sleep
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from time import monotonic
+from typing import Callable, Iterator
+
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
 
-def testDriver():
-    driver = getWebDriver()
 
-    driver.get("https://google.com")
-    sleep(5)
-    driver.close()
+def testDriver(pages: int = 1, url: str = "https://google.com"):
+    """ Opens `url` `pages` times with the drivers of the pool and quits them """
+    pool = get_driver_pool()
+    try:
+        for page in range(pages):
+            with pool.driver() as driver:
+                driver.get(url)
+                logger.info(f"Page {page + 1} of {pages} is loaded: {driver.title}")
+    finally:
+        close_driver_pool()
 
 
 def getWebDriver() -> webdriver.Chrome:
@@ -21,4 +34,216 @@ def getWebDriver() -> webdriver.Chrome:
     options.headless = settings.IS_HEADLESS_MODE
     driver = webdriver.Chrome(service=service, options=options)
     driver.set_page_load_timeout(settings.TIMEOUT_TIME)
-    return driver
\ No newline at end of file
+    return driver
+
+
+def process_tree_rss(pid: int) -> int:
+    """ Returns resident memory (bytes) of the process `pid` and all its descendants.
+    Descendants are found by `/proc/<pid>/task/<tid>/children`, so only the driver's own process tree
+    is read. It is 0 on the systems without `/proc`. """
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1])
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, IndexError, ValueError):
+            continue
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class PooledDriver:
+    """ Webdriver of the pool with its usage """
+
+    def __init__(self, driver: webdriver.Chrome) -> None:
+        self.driver = driver
+        self.pages = 0
+
+    @property
+    def memory(self) -> int:
+        """ Resident memory of the driver and its browser processes, bytes """
+        process = getattr(self.driver.service, "process", None)
+        return process_tree_rss(process.pid) if process else 0
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Can't quit webdriver: {e}")
+
+
+class DriverPool:
+    """ Pool of warm headless drivers, so browser scraping costs page load time instead of browser start.
+    Driver is checked out for one page (`driver()` context manager or `checkout` and `checkin`).
+    Drivers are recycled (quit and started again on demand) after `max_pages` pages, when their processes
+    use more than `max_memory_mb` megabytes or when the page raised an error. """
+
+    def __init__(self,
+                 size: int | None = None,
+                 max_pages: int | None = None,
+                 max_memory_mb: int | None = None,
+                 factory: Callable[[], webdriver.Chrome] = getWebDriver) -> None:
+        self.size = settings.DRIVER_POOL_SIZE if size is None else size
+        self.max_pages = settings.DRIVER_MAX_PAGES if max_pages is None else max_pages
+        self.max_memory_mb = settings.DRIVER_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+        self.factory = factory
+
+        self._idle: LifoQueue[PooledDriver] = LifoQueue()  # the warmest driver is reused first
+        self._checked_out: dict[int, PooledDriver] = {}
+        self._started = 0
+        self._recycled = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def warmUp(self, count: int | None = None):
+        """ Starts `count` drivers (the whole pool by default) ahead of the first pages """
+        started = []
+        for _ in range(self.size if count is None else count):
+            pooled = self.__start()
+            if not pooled:
+                break
+            started.append(pooled)
+        for pooled in started:
+            self._idle.put(pooled)
+
+    def checkout(self, timeout: float | None = None) -> webdriver.Chrome:
+        """ Returns idle driver, starts new one if pool is not full or waits for a returned one
+
+        Args:
+            timeout (float | None, optional): seconds to wait for a driver. Defaults to None (forever).
+
+        Raises:
+            TimeoutError: all drivers are busy for `timeout` seconds
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+                break
+            except Empty:
+                pass
+
+            pooled = self.__start()
+            if pooled:
+                break
+
+            # recycled drivers free their place without returning to the queue, so it is polled
+            wait_time = 1.0 if deadline is None else min(1.0, deadline - monotonic())
+            if wait_time <= 0:
+                raise TimeoutError(f"All {self.size} webdrivers are busy for {timeout} seconds!")
+            try:
+                pooled = self._idle.get(timeout=wait_time)
+                break
+            except Empty:
+                continue
+
+        with self._lock:
+            self._checked_out[id(pooled.driver)] = pooled
+        return pooled.driver
+
+    def checkin(self, driver: webdriver.Chrome, broken: bool = False):
+        """ Returns driver to the pool. Driver is quit instead if it is `broken`,
+        served `max_pages` pages or uses more than `max_memory_mb` megabytes. """
+        with self._lock:
+            pooled = self._checked_out.pop(id(driver))
+        pooled.pages += 1
+
+        reason = self.__recycleReason(pooled, broken=broken)
+        if not reason:
+            try:
+                # leave the page, so its memory is freed while the driver is idle
+                driver.get("about:blank")
+            except Exception as e:
+                reason = f"it can't leave the page: {e}"
+
+        if reason:
+            logger.info(f"Webdriver is recycled after {pooled.pages} pages, because {reason}")
+            self.__discard(pooled)
+            return
+
+        self._idle.put(pooled)
+
+    @contextmanager
+    def driver(self, timeout: float | None = None) -> Iterator[webdriver.Chrome]:
+        """ Checks out driver for the `with` block. Driver is recycled if the block raised an error. """
+        driver = self.checkout(timeout=timeout)
+        broken = True
+        try:
+            yield driver
+            broken = False
+        finally:
+            self.checkin(driver, broken=broken)
+
+    def close(self):
+        """ Quits idle drivers. Drivers, that are checked out, are quit when they are returned. """
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except Empty:
+                break
+            self.__discard(pooled)
+
+    def summary(self) -> str:
+        """ Returns human readable usage of the pool """
+        return (
+            f"Webdriver pool: {self._started} drivers started, {self._recycled} recycled, "
+            f"{self._idle.qsize()} idle, {len(self._checked_out)} checked out")
+
+    def __start(self) -> PooledDriver | None:
+        """ Starts new driver if the pool is not full. None if it is full. """
+        with self._lock:
+            if self._started - self._recycled >= self.size:
+                return None
+            self._started += 1
+
+        try:
+            return PooledDriver(self.factory())
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def __recycleReason(self, pooled: PooledDriver, broken: bool) -> str | None:
+        if self._closed:
+            return "pool is closed"
+        if broken:
+            return "page raised an error"
+        if self.max_pages and pooled.pages >= self.max_pages:
+            return f"it served {self.max_pages} pages"
+        if self.max_memory_mb:
+            memory_mb = pooled.memory / 1024 / 1024
+            if memory_mb > self.max_memory_mb:
+                return f"it uses {memory_mb:.0f} MB of memory (max {self.max_memory_mb} MB)"
+        return None
+
+    def __discard(self, pooled: PooledDriver):
+        pooled.quit()
+        with self._lock:
+            self._recycled += 1
+
+
+__pool: DriverPool | None = None
+__pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """ Returns webdriver pool of the process. It is shared by all browser scrapers. """
+    global __pool
+    with __pool_lock:
+        if __pool is None:
+            __pool = DriverPool()
+        return __pool
+
+
+def close_driver_pool():
+    """ Quits drivers of the process pool, e.g. at the end of the command """
+    global __pool
+    with __pool_lock:
+        if __pool is not None:
+            __pool.close()
+            logger.info(__pool.summary())
+            __pool = None
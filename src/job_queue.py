@@ -0,0 +1,149 @@
+import logging
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from src.keyword_queue import KeywordQueue, KeywordTask
+from src.run_plan import KeywordPlan
+from web.kwfinder import models
+from web.kwfinder.services.metrics import worker_name
+
+logger = logging.getLogger(__name__)
+
+
+class RunJobQueue(KeywordQueue):
+    """ Keyword queue of one worker process, that claims keyword tasks of the run from the database
+    in batches. Many workers, on one host or several, can process the same run: claimed
+    rows are locked with `SKIP LOCKED` where the database supports it, other databases
+    (SQLite) rely on a conditional update. Claims of a worker are renewed on every batch
+    and while its tasks are processed, so claims that are older than `claim_timeout` seconds
+    belong to a dead worker and are given to other workers. """
+
+    def __init__(self,
+                 run: models.AppPositionScriptRun,
+                 plan: tuple[KeywordPlan, ...],
+                 worker: str | None = None,
+                 batch_size: int | None = None,
+                 claim_timeout: float | None = None,
+                 poll_interval: float | None = None,
+                 max_attempts: int = 3,
+                 retry_delay: float = 60,
+                 deadline: float | None = None) -> None:
+        super().__init__(keywords=[], max_attempts=max_attempts, retry_delay=retry_delay, deadline=deadline)
+        self.run = run
+        self.worker = worker or worker_name()
+        self.batch_size = settings.WORKER_CLAIM_BATCH_SIZE if batch_size is None else batch_size
+        self.claim_timeout = settings.WORKER_CLAIM_TIMEOUT if claim_timeout is None else claim_timeout
+        self.poll_interval = settings.WORKER_POLL_INTERVAL if poll_interval is None else poll_interval
+
+        self._plan = {keyword.keyword_id: keyword for keyword in plan}
+        self._next_claim_at = 0.0
+        self._renew_claims_at = 0.0
+
+    def _refill(self) -> bool:
+        """ Claims next batch of tasks. While other workers still have pending tasks of the run
+        and this worker is idle, polls the database, because their claims can be released. """
+        while True:
+            if self.deadline is not None and monotonic() >= self.deadline:
+                return False
+
+            if monotonic() >= self._next_claim_at:
+                keywords = self.__claim()
+                if keywords:
+                    self.put(keywords)
+                    return True
+
+                self._next_claim_at = monotonic() + self.poll_interval
+                if not self.__hasPendingTasks():
+                    return False
+
+            # keywords in progress and delayed retries can be served meanwhile, `get` waits for them
+            if self._in_progress or self._delayed:
+                return False
+
+            wait_time = self._next_claim_at - monotonic()
+            if self.deadline is not None:
+                wait_time = min(wait_time, self.deadline - monotonic())
+            self._condition.wait(max(0, wait_time))
+            if self._tasks:
+                return True
+
+    def done(self, task: KeywordTask) -> int:
+        finished = super().done(task)
+        self.__renewClaims()
+        return finished
+
+    def retry(self, task: KeywordTask) -> bool:
+        queued = super().retry(task)
+        self.__renewClaims()
+        return queued
+
+    def release(self) -> int:
+        """ Releases pending tasks claimed by this worker, so other workers can take them
+
+        Returns:
+            int: number of released tasks
+        """
+        released = self.__tasks().filter(claimed_by=self.worker).update(claimed_by="", claimed_at=None)
+        if released:
+            logger.info(f"Worker {self.worker} released {released} tasks of run {self.run.id}")
+        return released
+
+    def __tasks(self):
+        return models.AppPositionScriptRunTask.objects.filter(
+            run=self.run, state=models.AppPositionScriptRunTask.PENDING)
+
+    def __renewClaims(self):
+        """ Renews claims of this worker, so a batch that takes longer than `claim_timeout`
+        (retries, ip rotations) isn't given to other workers. Claims are renewed
+        not more often than four times in `claim_timeout`. """
+        if monotonic() < self._renew_claims_at:
+            return
+
+        self._renew_claims_at = monotonic() + self.claim_timeout / 4
+        self.__tasks().filter(claimed_by=self.worker).update(claimed_at=timezone.now())
+
+    def __hasPendingTasks(self) -> bool:
+        return self.__tasks().exists()
+
+    def __claim(self) -> list[KeywordPlan]:
+        """ Claims up to `batch_size` free tasks of the run and returns their keywords """
+        while True:
+            now = timezone.now()
+            free = Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=self.claim_timeout))
+
+            with transaction.atomic():
+                self.__tasks().filter(claimed_by=self.worker).update(claimed_at=now)
+
+                tasks = self.__tasks().filter(free).order_by("id")
+                if connection.features.has_select_for_update_skip_locked:
+                    tasks = tasks.select_for_update(skip_locked=True)
+                ids = list(tasks.values_list("id", flat=True)[:self.batch_size])
+                if not ids:
+                    return []
+
+                expired = self.__tasks().filter(
+                    id__in=ids, claimed_at__isnull=False).values_list("claimed_by", flat=True)
+                for worker in set(expired):
+                    logger.warning(f"Claims of worker {worker} in run {self.run.id} are expired. Releasing them.")
+
+                self.__tasks().filter(free, id__in=ids).update(claimed_by=self.worker, claimed_at=now)
+
+            claimed = self.__tasks().filter(id__in=ids, claimed_by=self.worker)
+            keywords = [self._plan[keyword_id]
+                        for keyword_id in claimed.values_list("keyword_id", flat=True)
+                        if keyword_id in self._plan]
+
+            unknown = claimed.exclude(keyword_id__in=self._plan.keys()).update(
+                state=models.AppPositionScriptRunTask.FAILED, finished_at=now)
+            if unknown:
+                logger.warning(
+                    f"{unknown} tasks of run {self.run.id} are not in the run plan anymore. Marked them as failed.")
+
+            if keywords:
+                logger.info(f"Worker {self.worker} claimed {len(keywords)} tasks of run {self.run.id}")
+                return keywords
@@ -1,6 +1,7 @@
 from datetime import date
 import logging
 
+from web.kwfinder.services import metrics
 from web.kwfinder.services.keitaro import KeitaroAPIService
 from web.kwfinder import models
 
@@ -52,5 +53,6 @@ def update_keitaro_stats(date_from: date, date_to: date):
         stat.revenue = row[models.KeitaroDailyAppData.REVENUE_FIELD_NAME]
 
         stat.save()
+        metrics.JOB_ITEMS.inc(job="update_keitaro_stats", result="saved")
 
     logger.info("Update ended!")
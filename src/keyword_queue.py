@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from time import monotonic
+
+from src.run_plan import KeywordPlan
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class KeywordTask:
+    keyword: KeywordPlan
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class KeywordQueue:
+    """ Shared queue of keywords for scraper workers. Idle worker takes the next
+    keyword, failed keyword goes back to the queue after `retry_delay` seconds until it runs out of attempts.
+    Delayed retries wait aside, ordered by their time, so they don't hold back the keywords that are ready. """
+
+    def __init__(self,
+                 keywords: list[KeywordPlan] | tuple[KeywordPlan, ...],
+                 max_attempts: int = 3,
+                 retry_delay: float = 60,
+                 deadline: float | None = None) -> None:
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.deadline = deadline
+        self.out_of_time = False
+        self.total = len(keywords)
+        self.completed = 0
+        self.failed: list[KeywordPlan] = []
+
+        self._tasks = deque(KeywordTask(keyword=keyword) for keyword in keywords)
+        self._delayed: list[tuple[float, int, KeywordTask]] = []  # heap by `not_before`
+        self._sequence = itertools.count()
+        self._in_progress = 0
+        self._condition = threading.Condition()
+
+    def get(self) -> KeywordTask | None:
+        """ Returns next keyword task. Ready keywords (and refills) go before delayed retries.
+        Blocks while there are only delayed retries or keywords in progress that can be retried.
+
+        Returns:
+            KeywordTask | None: task to process. None if every keyword is processed or failed,
+                or the `deadline` (`time.monotonic` value) is passed.
+        """
+        with self._condition:
+            while True:
+                if self.deadline is not None and monotonic() >= self.deadline:
+                    if not self.out_of_time:
+                        self.out_of_time = True
+                        logger.warning(
+                            f"Time budget is over. {len(self._tasks) + len(self._delayed)} keywords are left in the queue.")
+                    return None
+
+                self.__readyDelayed()
+                if not self._tasks and self._refill():
+                    continue
+
+                if self._tasks:
+                    self._in_progress += 1
+                    return self._tasks.popleft()
+
+                if self._delayed:
+                    wait_time = self._delayed[0][0] - monotonic()
+                    if self.deadline is not None:
+                        wait_time = min(wait_time, self.deadline - monotonic())
+                    self._condition.wait(max(0, wait_time))
+                    continue
+
+                if self._in_progress == 0:
+                    return None
+
+                self._condition.wait()
+
+    def put(self, keywords: list[KeywordPlan] | tuple[KeywordPlan, ...]):
+        """ Adds `keywords` to the end of the queue """
+        with self._condition:
+            self.total += len(keywords)
+            self._tasks.extend(KeywordTask(keyword=keyword) for keyword in keywords)
+            self._condition.notify_all()
+
+    def _refill(self) -> bool:
+        """ Called, when there are no tasks left. Subclasses can add more keywords here with `put`.
+
+        Returns:
+            bool: True if keywords are added
+        """
+        return False
+
+    def done(self, task: KeywordTask) -> int:
+        """ Marks `task` as processed
+
+        Returns:
+            int: number of processed and failed keywords
+        """
+        with self._condition:
+            self._in_progress -= 1
+            self.completed += 1
+            self._condition.notify_all()
+            return self.completed + len(self.failed)
+
+    def retry(self, task: KeywordTask) -> bool:
+        """ Returns failed `task` to the queue if it has attempts left
+
+        Returns:
+            bool: True if task is queued again, False if it is out of attempts
+        """
+        with self._condition:
+            self._in_progress -= 1
+            task.attempts += 1
+
+            if task.attempts >= self.max_attempts:
+                self.failed.append(task.keyword)
+                self._condition.notify_all()
+                return False
+
+            task.not_before = monotonic() + self.retry_delay
+            heapq.heappush(self._delayed, (task.not_before, next(self._sequence), task))
+            self._condition.notify_all()
+            return True
+
+    def __readyDelayed(self):
+        """ Moves delayed retries, whose time has come, to the end of the queue """
+        now = monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._tasks.append(heapq.heappop(self._delayed)[2])
@@ -1,212 +1,409 @@
 import logging
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from datetime import datetime
-from time import sleep
+from time import monotonic
 from typing import List
 
 from django.conf import settings
-from django.db.models import Count, Q
-from django.db.models.query import QuerySet
-from requests import Session
 
-from exceptions import LinksNotFound
+from exceptions import LinksNotFound, SearchThrottled
+from src.job_queue import RunJobQueue
+from src.keyword_queue import KeywordQueue
 from src.links import getGoogleLinks
+from src.position_store import position_counts
+from src.position_writer import PositionWriter
+from src.rate_limiter import get_rate_limiter, rates_repr
+from src.run_plan import KeywordPlan, tracked_package_ids
+from src.run_state import finish_run_if_done, join_run, run_deadline, start_run
+from src.serp_cache import SerpCache
+from src.serp_snapshots import snapshot_package_ids
 from web.kwfinder import models
-from web.kwfinder.services.proxy.simple_proxy import (
-    create_proxy_requests_session, get_proxy, safe_proxy_repr)
+from web.kwfinder.services import metrics
+from web.kwfinder.services.link_extractors import positions_by_package_id
+from web.kwfinder.services.parse_pool import ParsePool
+from web.kwfinder.services.proxy.proxy_pool import ProxyPool, get_proxy_pool
 
 logger = logging.getLogger(__name__)
 
 
-def getKeywordsStats():
-    """Gets all keywords statistics by threads and writes it to database"""
+@dataclass
+class RunContext:
+    """Objects that are shared by all scraper threads of one run"""
+    run: models.AppPositionScriptRun
+    keywords_queue: KeywordQueue
+    serp_cache: SerpCache
+    writer: PositionWriter
+    tracked_package_ids: dict[tuple[str, str], frozenset[str]] = field(default_factory=dict)
+    traffic: metrics.SerpTraffic = field(default_factory=metrics.SerpTraffic)
+    parse_pool: ParsePool | None = None
+
+
+def getKeywordsStats(resume: bool = False,
+                     run_id: int | None = None,
+                     adaptive: bool = False,
+                     time_budget: float | None = None):
+    """Gets all keywords statistics by threads and writes it to database.
+    Keywords are processed in order of their priority (see `build_run_plan`)
+
+    Args:
+        resume (bool, optional): continue unfinished run from its last checkpoint
+            instead of starting new one. Defaults to False.
+        run_id (int | None, optional): id of the run to resume. Defaults to the last unfinished run.
+        adaptive (bool, optional): scrape stable keywords less often. Defaults to False.
+        time_budget (float | None, optional): seconds after which no new keywords are taken.
+            Defaults to `settings.RUN_TIME_BUDGET`.
+    """
     logger.info("Getting keywords statistics.")
+    deadline = run_deadline(time_budget)
+
+    started = start_run(resume=resume, run_id=run_id, adaptive=adaptive)
+    if not started:
+        return
 
-    script_run = models.AppPositionScriptRun()
-    script_run.save()
-    splitted_keywords = __getSplittedKeywords()
-    with ThreadPoolExecutor(settings.NUMBER_OF_THREADS) as executor:
+    script_run, keywords = started
+    context = RunContext(
+        run=script_run,
+        keywords_queue=KeywordQueue(
+            keywords=keywords,
+            max_attempts=settings.KEYWORD_MAX_ATTEMPTS,
+            retry_delay=settings.KEYWORD_RETRY_DELAY,
+            deadline=deadline,
+        ),
+        serp_cache=SerpCache(),
+        writer=PositionWriter(run_id=script_run.id),
+        tracked_package_ids=tracked_package_ids(keywords),
+        parse_pool=__createParsePool(),
+    )
+    with context.writer, context.parse_pool or nullcontext(), ThreadPoolExecutor(settings.NUMBER_OF_THREADS) as executor:
         executor.map(
             __keywordsThreadFunc,
-            splitted_keywords,
             [
-                script_run,
+                context,
             ]
             * settings.NUMBER_OF_THREADS,
             range(settings.NUMBER_OF_THREADS),
         )
-    script_run.ended_at = datetime.now()
-    script_run.save()
-
-
-def __keywordsThreadFunc(keywords: List[models.Keyword],
-                         run: models.AppPositionScriptRun,
-                         thread_num: int = 0):
-    """Func to get all stata for given `keywords list`
-    and write it to db for given `run`"""
-    logger.info(f"Started thread {thread_num} of run with id {run.id}")
-    proxies = get_proxy()
-    if not proxies:
-        logger.error("Can't find proxy. Aborting!")
+
+    keywords_queue = context.keywords_queue
+    if keywords_queue.failed:
+        logger.warning(
+            f"{len(keywords_queue.failed)} keywords are not processed in {keywords_queue.max_attempts} attempts: "
+            f"{', '.join(str(keyword) for keyword in keywords_queue.failed)}")
+
+    logger.info(
+        f"Processed {keywords_queue.completed} out of {keywords_queue.total} keywords in run {script_run.id}"
+        f"{' (time budget is over)' if keywords_queue.out_of_time else ''}")
+    logger.info(context.serp_cache.summary())
+    logger.info(context.traffic.summary(keywords=keywords_queue.completed))
+    logger.info(get_proxy_pool().summary())
+    finish_run_if_done(script_run)
+
+
+def getKeywordsStatsWorker(run_id: int | None = None, time_budget: float | None = None):
+    """Processes keywords of an unfinished run together with other worker processes.
+    Keywords are claimed from the run's tasks in the database, so workers can run on several hosts.
+    The last worker marks the run as ended.
+
+    Args:
+        run_id (int | None, optional): id of the run to join. Defaults to the last unfinished run.
+        time_budget (float | None, optional): seconds after which the worker doesn't claim new keywords.
+            Defaults to `settings.RUN_TIME_BUDGET`.
+    """
+    deadline = run_deadline(time_budget)
+    joined = join_run(run_id=run_id)
+    if not joined:
         return
 
-    # session = create_proxy_requests_session(proxy=proxies)
-    # if not session:
-    #     logger.error(f"Can't create session for proxy {safe_proxy_repr(proxies)}. Aborting!")
-    #     return
+    script_run, plan = joined
+    keywords_queue = RunJobQueue(
+        run=script_run,
+        plan=plan,
+        max_attempts=settings.KEYWORD_MAX_ATTEMPTS,
+        retry_delay=settings.KEYWORD_RETRY_DELAY,
+        deadline=deadline,
+    )
+    logger.info(f"Worker {keywords_queue.worker} is getting keywords statistics of run {script_run.id}.")
+
+    context = RunContext(
+        run=script_run,
+        keywords_queue=keywords_queue,
+        serp_cache=SerpCache(),
+        writer=PositionWriter(run_id=script_run.id),
+        tracked_package_ids=tracked_package_ids(plan),
+        parse_pool=__createParsePool(),
+    )
+    try:
+        with context.writer, context.parse_pool or nullcontext(), ThreadPoolExecutor(settings.NUMBER_OF_THREADS) as executor:
+            executor.map(
+                __keywordsThreadFunc,
+                [
+                    context,
+                ]
+                * settings.NUMBER_OF_THREADS,
+                range(settings.NUMBER_OF_THREADS),
+            )
+    finally:
+        keywords_queue.release()
+
+    logger.info(
+        f"Worker {keywords_queue.worker} processed {keywords_queue.completed} keywords of run {script_run.id}, "
+        f"failed {len(keywords_queue.failed)}")
+    logger.info(context.serp_cache.summary())
+    logger.info(context.traffic.summary(keywords=keywords_queue.completed))
+    logger.info(get_proxy_pool().summary())
+    finish_run_if_done(script_run)
+
+
+def __createParsePool() -> ParsePool | None:
+    """Returns pool of `settings.PARSE_PROCESSES` parser processes. None if pages are parsed in scraper threads."""
+    if settings.PARSE_PROCESSES <= 0:
+        return None
+    if settings.SERP_STREAMING:
+        logger.warning("Search pages are parsed while they are streamed, PARSE_PROCESSES is ignored.")
+        return None
+    return ParsePool(processes=settings.PARSE_PROCESSES)
+
+
+def __keywordsThreadFunc(context: RunContext, thread_num: int = 0):
+    """Func to get stata for keywords from run's keywords queue
+    and write it to db for the run"""
+    logger.info(f"Started thread {thread_num} of run with id {context.run.id}")
+    proxy_pool = get_proxy_pool()
+    if not len(proxy_pool):
+        logger.error("Can't find proxy. Aborting!")
+        return
 
-    for i, keyword in enumerate(keywords):
-        if i % 10 == 0:
-            logger.info(
-                f"Thread {thread_num} - completed {i} out of {len(keywords)}")
+    keywords_queue = context.keywords_queue
 
-        session = Session()
-        session.proxies = proxies
+    while True:
+        task = keywords_queue.get()
+        if not task:
+            break
 
-        if not __precessKeyword(
-            keyword=keyword,
-            run=run,
+        if __precessKeyword(
+            keyword=task.keyword,
+            context=context,
+            proxy_pool=proxy_pool,
             thread_num=thread_num,
-            session=session
         ):
+            metrics.KEYWORDS_PROCESSED.inc(region=task.keyword.region_code, result="done")
+            finished = keywords_queue.done(task)
+            if finished % 10 == 0:
+                logger.info(
+                    f"Thread {thread_num} - completed {finished} out of {keywords_queue.total}. {rates_repr()}")
+            continue
+
+        if keywords_queue.retry(task):
+            metrics.KEYWORD_RETRIES.inc(region=task.keyword.region_code)
             logger.warning(
-                f"Error while processing keyword in thread {thread_num}! Sleep for 60 seconds and try again.")
-            sleep(60)
-            session = Session()
-            session.proxies = proxies
-            if not __precessKeyword(
-                keyword=keyword,
-                run=run,
-                thread_num=thread_num,
-                session=session
-            ):
-                break
+                f"Error while processing keyword {task.keyword} in thread {thread_num}! "
+                f"It will be tried again in {keywords_queue.retry_delay} seconds.")
+        else:
+            metrics.KEYWORDS_PROCESSED.inc(region=task.keyword.region_code, result="failed")
+            context.writer.fail(task.keyword.keyword_id)
+            logger.error(
+                f"Keyword {task.keyword} is not processed in {task.attempts} attempts. Skipping it!")
 
     logger.info(f"Finished thread {thread_num}")
 
 
-def __precessKeyword(keyword: models.Keyword,
-                     run: models.AppPositionScriptRun,
-                     thread_num: int = 0,
-                     session: Session | None = None) -> bool:
+def __precessKeyword(keyword: KeywordPlan,
+                     context: RunContext,
+                     proxy_pool: ProxyPool,
+                     thread_num: int = 0) -> bool:
     """Processing keyword in thread
 
     Args:
-        keyword (models.Keyword): keyword to process
-        run (models.AppPositionScriptRun): run object
-        attempt (int, optional): Attempt num. Defaults to 0.
+        keyword (KeywordPlan): keyword to process
+        context (RunContext): run objects
+        proxy_pool (ProxyPool): proxies to make requests through
         thread_num (int, optional): Thread num. Defaults to 0.
 
     Returns:
         Bool: True if processed successfully. Else False.
     """
-    sleep(settings.TIME_TO_SLEEP / 2)
-
     try:
-        __getKeywordStatistics(
-            keyword=keyword, thread_num=thread_num, run=run, session=session)
+        links = context.serp_cache.getOrFetch(
+            keyword=keyword.query,
+            attributes=keyword.store_attributes,
+            fetch=lambda: __downloadLinks(
+                keyword=keyword,
+                proxy_pool=proxy_pool,
+                thread_num=thread_num,
+                stop_package_ids=context.tracked_package_ids.get((keyword.query, keyword.store_attributes)),
+                parse_pool=context.parse_pool))
 
     except LinksNotFound as e:
         logger.warning(e)
+        metrics.LINKS_NOT_FOUND.inc(region=keyword.region_code)
+        context.writer.add([], keyword_id=keyword.keyword_id)
         return True
 
+    except SearchThrottled as e:
+        logger.warning(e)
+        return False
+
     except Exception as e:
         logger.exception(e)
         return False
 
+    context.writer.add(
+        getPositionRows(keyword=keyword, run_id=context.run.id, links=links),
+        keyword_id=keyword.keyword_id,
+        snapshot=getSerpSnapshot(links))
     return True
 
 
-def __getSplittedKeywords() -> List[List[models.Keyword]]:
-    """Returns lists of keywords splitted approximately
-    equal by the number of threads"""
-    keywords_qs = models.Keyword.objects.annotate(
-        app_count=Count("app", filter=Q(app__is_active=True))
-    ).exclude(app_count=0)
-
-    keywords = list(keywords_qs)
-    k, m = divmod(len(keywords), settings.NUMBER_OF_THREADS)
-    return [keywords[i * k + min(i, m): (i + 1) * k + min(i + 1, m)] for i in range(settings.NUMBER_OF_THREADS)]
-
-
-def __getKeywordStatistics(keyword: models.Keyword,
-                           thread_num: int,
-                           run: models.AppPositionScriptRun,
-                           session: Session | None = None):
-    """Returns statistic for `keyword`. It is dict. The key is app link,
-    value is position in google play store (0 if not exists)."""
-    if not keyword.region.google_store_link_attributes:
-        logger.warning(
-            f"Keyword {keyword} doesn't contain Google play market attributes!")
-        return
-
-    links = getGoogleLinks(
-        keyword=keyword.name,
-        thread_num=thread_num,
-        strore_attributes=keyword.region.google_store_link_attributes,
-        session=session
-    )
-    apps = keyword.app_set.filter(is_active=True)  # type: ignore
-    apps: QuerySet[models.App]
+def __downloadLinks(keyword: KeywordPlan,
+                    proxy_pool: ProxyPool,
+                    thread_num: int = 0,
+                    stop_package_ids: frozenset[str] | None = None,
+                    parse_pool: ParsePool | None = None) -> List[str]:
+    """Uploads links of `keyword` through the healthiest proxy of the pool for the keyword region,
+    respecting the proxy rate limiter, and reports the result to the rate limiter and the pool.
+    Block signals rotate mobile proxy ip, requests through the proxy wait for the rotation.
+    In streaming mode download stops once all `stop_package_ids` are found.
+    If `parse_pool` is given, the page is parsed in its worker process."""
+    proxy = proxy_pool.acquire(region_code=keyword.region_code)
+    rate_limiter = get_rate_limiter(proxy.name)
+    success = False
+    latency = None
+    result = "error"
+    request_time = None
 
-    if apps.count() == 0:
-        logger.warning(f"No apps found for keyword {keyword}!")
-        return
+    try:
+        proxy.waitReady()
+        session = proxy.session.get()
+        if not session:
+            raise ConnectionError(f"Can't create session for proxy {proxy} in thread {thread_num}!")
 
-    for app in apps:
+        rate_limiter.acquire()
+        started = monotonic()
         try:
-            position = links.index(app.link) + 1
-        except ValueError:
-            position = 0
-
-        data = models.AppPositionScriptRunData(
-            run=run, keyword=keyword, app=app, position=position)
-        data.save()
+            links = getGoogleLinks(
+                keyword=keyword.query,
+                thread_num=thread_num,
+                strore_attributes=keyword.store_attributes,
+                session=session,
+                base_url=keyword.base_url,
+                stop_package_ids=stop_package_ids,
+                parse_pool=parse_pool,
+            )
+        finally:
+            request_time = monotonic() - started
+        success, latency = True, request_time
+        result = "ok"
+
+    except LinksNotFound:
+        success = None
+        result = "not_found"
+        rate_limiter.throttled(reason="empty search results")
+        proxy_pool.emptyResults(proxy, requested_at=started)
+        raise
+
+    except SearchThrottled as e:
+        success = None
+        result = "throttled"
+        rate_limiter.throttled(reason=str(e))
+        proxy_pool.blocked(proxy, reason=str(e), requested_at=started)
+        raise
+
+    finally:
+        proxy_pool.release(proxy, success=success, latency=latency)
+        if request_time is not None:
+            metrics.REQUEST_DURATION.observe(request_time, region=keyword.region_code, result=result)
+
+    rate_limiter.success()
+    return links
+
+
+def getPositionRows(keyword: KeywordPlan,
+                    run_id: int,
+                    links: List[str]) -> List[models.AppPositionScriptRunData]:
+    """Returns position rows of `keyword` apps found in `links` for run with `run_id`"""
+    positions = positions_by_package_id(links)
+    return [
+        models.AppPositionScriptRunData(
+            run_id=run_id, keyword_id=keyword.keyword_id, app_id=app_id, position=positions.get(package_id, 0))
+        for app_id, package_id in keyword.apps
+    ]
+
+
+def getSerpSnapshot(links: List[str]) -> List[str] | None:
+    """Returns package ids of the search page top to store, if `settings.SERP_SNAPSHOTS` is on"""
+    if not settings.SERP_SNAPSHOTS:
+        return None
+    return snapshot_package_ids(links)
 
 
 def mergeKeywordStatsForDays(day: str):
-    """Merges all stats for a `day`"""
+    """Merges all stats for a `day`: position of every (app, keyword) pair is the most repeated
+    position of the day's runs or their average ignoring zeros (see `__getMaxRepeatedPositionOrAvg`).
+    Positions of all pairs are loaded with a few grouped queries. Aggregated rows are upserted
+    by (app, keyword, date), so a day can be merged again: only new and changed rows are written.
+    Pairs without positions in the day's runs (e.g. their raw rows are deleted) are skipped,
+    so their merged rows are kept."""
     logger.info(f"Starting merging stats for {day}.")
-    runs = list(
-        models.AppPositionScriptRun.objects.filter(
-            started_at__range=[f"{day} 00:00:00", f"{day} 23:59:59"]).all()
-    )
-    apps = models.App.objects.all()
+    runs = models.AppPositionScriptRun.objects.filter(started_at__range=[f"{day} 00:00:00", f"{day} 23:59:59"])
+    if not runs.exists():
+        logger.warning(f"There are no runs for {day}. Nothing to merge.")
+        return
 
-    data = []
-    for app in apps:
-        for keyword in app.keywords.all():
-            data.append(__aggregateKeywordStats(
-                day=day, app=app, keyword=keyword, runs=runs))
-
-    models.DailyAggregatedPositionData.objects.bulk_create(data)
-    logger.info(f"Merging is ended. {len(data)} instances created.")
-
-
-def __aggregateKeywordStats(
-    day: str, app: models.App, keyword: models.Keyword, runs: list[models.AppPositionScriptRun]
-) -> models.DailyAggregatedPositionData:
-    """Aggregates stats for given `day` for an `app` and `keyword`
-    in bunch of `runs` and returns DailyAggregatedPositionData instance"""
-    data = models.AppPositionScriptRunData.objects.filter(
-        keyword=keyword, run__in=runs, app=app).all()
-    position = __getMaxRepeatedElementOrAvg([d.position for d in data])
-
-    return models.DailyAggregatedPositionData(
-        date=datetime.strptime(day, r"%Y-%m-%d").date(), keyword=keyword, app=app, position=position
-    )
+    counts = position_counts(
+        data=models.AppPositionScriptRunData.objects.filter(run__in=runs),
+        tasks=models.AppPositionScriptRunTask.objects.filter(run__in=runs))
+
+    date = datetime.strptime(day, r"%Y-%m-%d").date()
+    merged = {
+        (keyword_id, app_id): position
+        for keyword_id, app_id, position in models.DailyAggregatedPositionData.objects.filter(
+            date=date).values_list("keyword_id", "app_id", "position").iterator(chunk_size=2000)
+    }
 
+    data = []
+    skipped = unchanged = 0
+    pairs = models.App.keywords.through.objects.values_list("app_id", "keyword_id")
+    for app_id, keyword_id in pairs.iterator(chunk_size=2000):
+        if (keyword_id, app_id) not in counts:
+            skipped += 1
+            continue
+
+        position = __getMaxRepeatedPositionOrAvg(counts[(keyword_id, app_id)])
+        if merged.get((keyword_id, app_id)) == position:
+            unchanged += 1
+            continue
+
+        data.append(models.DailyAggregatedPositionData(
+            date=date, keyword_id=keyword_id, app_id=app_id, position=position))
+
+    models.DailyAggregatedPositionData.objects.bulk_create(
+        data, batch_size=1000,
+        update_conflicts=True, unique_fields=["app", "keyword", "date"], update_fields=["position"])
+    created = sum(1 for row in data if (row.keyword_id, row.app_id) not in merged)
+    logger.info(
+        f"Merging is ended. {created} instances created, {len(data) - created} updated, "
+        f"{unchanged} are not changed. {skipped} pairs have no positions for the day.")
+
+
+def __getMaxRepeatedPositionOrAvg(counts: Counter[int]) -> int:
+    """Returns the most repeated position (the lowest one of equally repeated), if some position
+    is repeated, otherwise the average of positions ignoring zeros.
 
-def __getMaxRepeatedElementOrAvg(l: List[int]) -> int:
-    if len(l) == 0:
+    Args:
+        counts (Counter[int]): number of runs by position
+    """
+    total = sum(counts.values())
+    if total == 0:
         return 0
 
-    s = set(l)
-    if len(l) == len(s):
-        if len(l) == 1:
-            return l[0]
-        if 0 in l:
-            return int(sum(l) / (len(l) - 1))
-        return int(sum(l) / len(l))
+    if total == len(counts):
+        if total == 1:
+            return next(iter(counts))
+        if 0 in counts:
+            return int(sum(counts) / (total - 1))
+        return int(sum(counts) / total)
 
-    return max(s, key=l.count)
+    return min(counts, key=lambda position: (-counts[position], position))
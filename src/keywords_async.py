@@ -0,0 +1,321 @@
+import asyncio
+import logging
+from functools import partial
+from time import monotonic
+
+import aiohttp
+from django.conf import settings
+
+from exceptions import LinksNotFound, SearchThrottled, TimeBudgetExceeded
+from src.keywords import getPositionRows, getSerpSnapshot
+from src.position_writer import PositionWriter
+from src.rate_limiter import get_rate_limiter, rates_repr
+from src.run_plan import KeywordPlan, tracked_package_ids
+from src.run_state import finish_run_if_done, run_deadline, start_run
+from src.serp_cache import SerpCache
+from web.kwfinder import models
+from web.kwfinder.services import metrics
+from web.kwfinder.services.googlePlayServicePlain import (GooglePlayService,
+                                                           SerpStreamParser)
+from web.kwfinder.services.proxy.proxy_pool import (ProxyEndpoint, ProxyPool,
+                                                     get_proxy_pool)
+
+logger = logging.getLogger(__name__)
+
+
+def getKeywordsStatsAsync(resume: bool = False,
+                          run_id: int | None = None,
+                          adaptive: bool = False,
+                          time_budget: float | None = None):
+    """Gets all keywords statistics with asyncio and writes it to database.
+    Number of requests in flight is limited by `settings.ASYNC_CONCURRENCY`
+
+    Args:
+        resume (bool, optional): continue unfinished run from its last checkpoint
+            instead of starting new one. Defaults to False.
+        run_id (int | None, optional): id of the run to resume. Defaults to the last unfinished run.
+        adaptive (bool, optional): scrape stable keywords less often. Defaults to False.
+        time_budget (float | None, optional): seconds after which no new keywords are started.
+            Defaults to `settings.RUN_TIME_BUDGET`.
+    """
+    logger.info(
+        f"Getting keywords statistics in asyncio mode with concurrency {settings.ASYNC_CONCURRENCY}.")
+    deadline = run_deadline(time_budget)
+
+    proxy_pool = get_proxy_pool()
+    if not len(proxy_pool):
+        logger.error("Can't find proxy. Aborting!")
+        return
+
+    started = start_run(resume=resume, run_id=run_id, adaptive=adaptive)
+    if not started:
+        return
+
+    script_run, keywords = started
+    with PositionWriter(run_id=script_run.id) as writer:
+        asyncio.run(__run(keywords=keywords, run=script_run, writer=writer,
+                    proxy_pool=proxy_pool, deadline=deadline))
+
+    logger.info(proxy_pool.summary())
+    finish_run_if_done(script_run)
+
+
+async def __run(keywords: tuple[KeywordPlan, ...],
+                run: models.AppPositionScriptRun,
+                writer: PositionWriter,
+                proxy_pool: ProxyPool,
+                deadline: float | None = None):
+    """Processes all `keywords` concurrently in one event loop.
+    Keywords are started in order of the plan, so higher priority keywords go first"""
+    semaphore = asyncio.Semaphore(settings.ASYNC_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=settings.ASYNC_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=settings.TIMEOUT_TIME)
+    progress = {"completed": 0, "out_of_time": 0}
+    serp_cache = SerpCache()
+    in_flight: dict[str, asyncio.Future] = {}
+    tracked = tracked_package_ids(keywords)
+    traffic = metrics.SerpTraffic()
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*[
+            __processKeyword(
+                keyword=keyword,
+                run=run,
+                writer=writer,
+                session=session,
+                semaphore=semaphore,
+                proxy_pool=proxy_pool,
+                serp_cache=serp_cache,
+                in_flight=in_flight,
+                tracked=tracked,
+                progress=progress,
+                total=len(keywords),
+                deadline=deadline)
+            for keyword in keywords
+        ])
+
+    logger.info(f"Finished run {run.id}. Processed {progress['completed']} keywords")
+    if progress["out_of_time"]:
+        logger.warning(f"Time budget is over. {progress['out_of_time']} keywords are not started.")
+    logger.info(serp_cache.summary())
+    logger.info(traffic.summary(keywords=progress["completed"]))
+
+
+async def __processKeyword(keyword: KeywordPlan,
+                           run: models.AppPositionScriptRun,
+                           writer: PositionWriter,
+                           session: aiohttp.ClientSession,
+                           semaphore: asyncio.Semaphore,
+                           proxy_pool: ProxyPool,
+                           serp_cache: SerpCache,
+                           in_flight: dict[str, asyncio.Future],
+                           tracked: dict[tuple[str, str], frozenset[str]],
+                           progress: dict[str, int],
+                           total: int,
+                           deadline: float | None = None):
+    """Gets statistics for `keyword` and writes it to db. Failed keyword is tried again
+    after `settings.KEYWORD_RETRY_DELAY` seconds without blocking the others.
+    Keyword is left unprocessed if `deadline` is passed before it is started."""
+    for attempt in range(1, settings.KEYWORD_MAX_ATTEMPTS + 1):
+        try:
+            links = await __getCachedGoogleLinks(
+                keyword=keyword,
+                session=session,
+                semaphore=semaphore,
+                proxy_pool=proxy_pool,
+                serp_cache=serp_cache,
+                in_flight=in_flight,
+                stop_package_ids=tracked.get((keyword.query, keyword.store_attributes)),
+                deadline=deadline)
+
+            await writer.addAsync(
+                getPositionRows(keyword=keyword, run_id=run.id, links=links),
+                keyword_id=keyword.keyword_id,
+                snapshot=getSerpSnapshot(links))
+            metrics.KEYWORDS_PROCESSED.inc(region=keyword.region_code, result="done")
+            break
+
+        except LinksNotFound as e:
+            logger.warning(e)
+            metrics.LINKS_NOT_FOUND.inc(region=keyword.region_code)
+            metrics.KEYWORDS_PROCESSED.inc(region=keyword.region_code, result="done")
+            await writer.addAsync([], keyword_id=keyword.keyword_id)
+            break
+
+        except TimeBudgetExceeded:
+            progress["out_of_time"] += 1
+            return
+
+        except SearchThrottled as e:
+            logger.warning(e)
+
+        except Exception as e:
+            logger.exception(e)
+
+        if attempt < settings.KEYWORD_MAX_ATTEMPTS:
+            metrics.KEYWORD_RETRIES.inc(region=keyword.region_code)
+            logger.warning(
+                f"Error while processing keyword {keyword}! Sleep for {settings.KEYWORD_RETRY_DELAY} seconds and try again.")
+            await asyncio.sleep(settings.KEYWORD_RETRY_DELAY)
+        else:
+            metrics.KEYWORDS_PROCESSED.inc(region=keyword.region_code, result="failed")
+            await writer.failAsync(keyword.keyword_id)
+            logger.error(
+                f"Keyword {keyword} is not processed in {attempt} attempts. Skipping it!")
+
+    progress["completed"] += 1
+    if progress["completed"] % 10 == 0:
+        logger.info(f"Completed {progress['completed']} out of {total}. {rates_repr()}")
+
+
+async def __getCachedGoogleLinks(keyword: KeywordPlan,
+                                 session: aiohttp.ClientSession,
+                                 semaphore: asyncio.Semaphore,
+                                 proxy_pool: ProxyPool,
+                                 serp_cache: SerpCache,
+                                 in_flight: dict[str, asyncio.Future],
+                                 stop_package_ids: frozenset[str] | None = None,
+                                 deadline: float | None = None) -> list[str]:
+    """Returns links by the given `keyword` from `serp_cache` or uploads them.
+    Identical queries that are already in flight are awaited instead of uploaded again.
+    In streaming mode download stops once all `stop_package_ids` are found.
+    Raises `TimeBudgetExceeded` if `deadline` is passed before the upload is started."""
+    attributes = keyword.store_attributes
+    key = serp_cache.key(keyword=keyword.query, attributes=attributes)
+
+    if key in in_flight:
+        serp_cache.hits += 1
+        return await asyncio.shield(in_flight[key])
+
+    links = serp_cache.get(keyword=keyword.query, attributes=attributes)
+    if links is not None:
+        return links
+
+    async def fetch() -> list[str]:
+        # proxy is chosen only when the request can be made, so it is picked by fresh health data
+        # and `in_use` counts requests in flight only
+        async with semaphore:
+            proxy = await proxy_pool.acquireAsync(region_code=keyword.region_code)
+            try:
+                return await __fetchThroughProxy(
+                    keyword=keyword, session=session, proxy_pool=proxy_pool, proxy=proxy,
+                    stop_package_ids=stop_package_ids, deadline=deadline)
+            finally:
+                proxy_pool.release(proxy)
+
+    future = asyncio.ensure_future(fetch())
+    in_flight[key] = future
+    try:
+        links = await future
+    finally:
+        del in_flight[key]
+
+    serp_cache.set(keyword=keyword.query, attributes=attributes, links=links)
+    return links
+
+
+async def __fetchThroughProxy(keyword: KeywordPlan,
+                              session: aiohttp.ClientSession,
+                              proxy_pool: ProxyPool,
+                              proxy: ProxyEndpoint,
+                              stop_package_ids: frozenset[str] | None = None,
+                              deadline: float | None = None) -> list[str]:
+    """Uploads links by the given `keyword` through `proxy` respecting its rate limiter
+    and reports the result to the rate limiter and the proxy pool.
+    Block signals rotate mobile proxy ip, requests through the proxy wait for the rotation.
+    Must be called inside the concurrency semaphore."""
+    rate_limiter = get_rate_limiter(proxy.name)
+    if deadline is not None and monotonic() >= deadline:
+        raise TimeBudgetExceeded(f"Time budget is over before keyword {keyword} is started")
+
+    await proxy.waitReadyAsync()
+    # token is taken right before the request, so no more than ASYNC_CONCURRENCY requests
+    # wait for the rate limiter and the schedule follows the current rate
+    if deadline is None:
+        await rate_limiter.acquireAsync()
+    else:
+        try:
+            await asyncio.wait_for(rate_limiter.acquireAsync(), timeout=max(0, deadline - monotonic()))
+        except asyncio.TimeoutError:
+            raise TimeBudgetExceeded(f"Time budget is over before keyword {keyword} is started")
+
+    started = monotonic()
+    try:
+        links = await __getGoogleLinks(
+            keyword=keyword, session=session, proxy=proxy.proxies['https'], stop_package_ids=stop_package_ids)
+
+    except LinksNotFound:
+        __observeRequest(keyword=keyword, started=started, result="not_found")
+        rate_limiter.throttled(reason="empty search results")
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(proxy_pool.emptyResults, proxy, requested_at=started))
+        raise
+
+    except SearchThrottled as e:
+        __observeRequest(keyword=keyword, started=started, result="throttled")
+        rate_limiter.throttled(reason=str(e))
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(proxy_pool.blocked, proxy, reason=str(e), requested_at=started))
+        raise
+
+    except Exception:
+        __observeRequest(keyword=keyword, started=started, result="error")
+        proxy_pool.record(proxy, success=False)
+        raise
+
+    latency = __observeRequest(keyword=keyword, started=started, result="ok")
+    rate_limiter.success()
+    proxy_pool.record(proxy, success=True, latency=latency)
+    return links
+
+
+async def __streamGoogleLinks(r: aiohttp.ClientResponse,
+                              url: str,
+                              stop_package_ids: frozenset[str] | None = None) -> list[str]:
+    """Parses search page while it is downloaded and stops download once the rest of the page is not needed"""
+    try:
+        parser = SerpStreamParser(
+            url=url, status_code=r.status, response_url=str(r.url),
+            encoding=r.charset, stop_package_ids=stop_package_ids)
+        async for chunk in r.content.iter_chunked(settings.SERP_STREAM_CHUNK_SIZE):
+            if parser.feed(chunk):
+                break
+        return parser.close()
+
+    finally:
+        GooglePlayService.recordTraffic(
+            mode="streamed", downloaded=r.content.total_bytes, content_length=r.content_length or 0)
+        r.close()
+
+
+def __observeRequest(keyword: KeywordPlan, started: float, result: str) -> float:
+    """Adds time of the request started at `started` to the request metrics and returns it"""
+    latency = monotonic() - started
+    metrics.REQUEST_DURATION.observe(latency, region=keyword.region_code, result=result)
+    return latency
+
+
+async def __getGoogleLinks(keyword: KeywordPlan,
+                           session: aiohttp.ClientSession,
+                           proxy: str,
+                           stop_package_ids: frozenset[str] | None = None) -> list[str]:
+    """Uploads and returns links by the given `keyword`.
+    In streaming mode download stops once all `stop_package_ids` are found."""
+    gPS = GooglePlayService(base_url=keyword.base_url)
+    url = gPS.buildSearchUrl(keyword=keyword.query, attributes=keyword.store_attributes)
+
+    async with session.get(url, proxy=proxy) as r:
+        if settings.SERP_STREAMING:
+            links = await __streamGoogleLinks(r, url=url, stop_package_ids=stop_package_ids)
+        else:
+            html = await r.text()
+            # aiohttp doesn't tell compressed size, so decompressed size is counted
+            gPS.recordTraffic(mode="full", downloaded=r.content.total_bytes)
+            gPS.checkThrottled(status_code=r.status, url=str(r.url), html=html)
+            links = gPS.parseAppLinks(html=html, url=url)
+
+    logger.debug(f"{len(links)} links loaded for keyword {keyword}")
+    if len(links) == 0:
+        raise LinksNotFound(f"Didn't find any links for keyword {keyword}!")
+
+    return links
@@ -1,21 +1,33 @@
 import logging
 from typing import List
 
+from django.conf import settings
 from requests import Session
 
 from exceptions import LinksNotFound
 from web.kwfinder import models
 from web.kwfinder.services.googlePlayServicePlain import GooglePlayService
+from web.kwfinder.services.parse_pool import ParsePool
 
 logger = logging.getLogger(__name__)
 
 
-def getGoogleLinks(keyword: str, strore_attributes: str, thread_num: int = 0, session: Session | None = None) -> List[str]:
-    """Uploads and returns links by the given `keyword`."""
+def getGoogleLinks(keyword: str,
+                   strore_attributes: str,
+                   thread_num: int = 0,
+                   session: Session | None = None,
+                   base_url: str | None = None,
+                   stop_package_ids: set[str] | None = None,
+                   parse_pool: ParsePool | None = None) -> List[str]:
+    """Uploads and returns links by the given `keyword`.
+    If `base_url` is not given, it is loaded from database.
+    In streaming mode download stops once all `stop_package_ids` are found.
+    If `parse_pool` is given, pages are parsed in its worker processes."""
     logger.info(f"Getting links for keyword {keyword} with store attributes {strore_attributes} in thread {thread_num}")
-    gPS = GooglePlayService(base_url=__getGoogleBaseUrl(), thread_num=thread_num, session=session)
+    gPS = GooglePlayService(
+        base_url=base_url or getGoogleBaseUrl(), thread_num=thread_num, session=session, parse_pool=parse_pool)
 
-    links = gPS.getAllAppLinks(keyword=keyword, attributes=strore_attributes)
+    links = gPS.getAllAppLinks(keyword=keyword, attributes=strore_attributes, stop_package_ids=stop_package_ids)
     logger.info(f"{len(links)} links loaded in thread {thread_num}")
     if len(links) == 0:
         raise LinksNotFound(f"Didn't find any links in thread {thread_num}!")
@@ -23,8 +35,12 @@ def getGoogleLinks(keyword: str, strore_attributes: str, thread_num: int = 0, se
     return links
 
 
-def __getGoogleBaseUrl() -> str:
-    """Returns base search link for platform Google"""
+def getGoogleBaseUrl() -> str:
+    """Returns base search link for platform Google.
+    `settings.GOOGLE_PLAY_BASE_URL` overrides the link from database (e.g. for the stand-in server)."""
+    if settings.GOOGLE_PLAY_BASE_URL:
+        return settings.GOOGLE_PLAY_BASE_URL
+
     platform = models.AppPlatform.objects.get(name="Google")
     return platform.base_store_link
 
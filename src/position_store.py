@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+from typing import Collection, Iterable, Iterator
+
+from django.db.models import Count, QuerySet
+
+from web.kwfinder import models
+
+PositionValue = tuple[int, int, int, int]  # run id, keyword id, app id, position
+
+
+def position_values(data: QuerySet,
+                    tasks: QuerySet,
+                    app_ids: Collection[int] | None = None) -> list[PositionValue]:
+    """ Returns (run id, keyword id, app id, position) of the stored position rows and zero positions
+    of the apps, that were checked in sparse runs (see `PositionWriter`), but are not stored.
+
+    Args:
+        data (QuerySet): `AppPositionScriptRunData` rows
+        tasks (QuerySet): `AppPositionScriptRunTask` of the same runs and keywords as `data`
+        app_ids (Collection[int] | None, optional): apps of `data`. Defaults to None (all apps).
+
+    Returns:
+        list[PositionValue]: positions of all checked pairs
+    """
+    values = list(data.values_list("run_id", "keyword_id", "app_id", "position"))
+    stored = {(run_id, keyword_id, app_id) for run_id, keyword_id, app_id, _ in values}
+    checks = tasks.filter(checked_app_ids__isnull=False).values_list("run_id", "keyword_id", "checked_app_ids")
+    values += [(run_id, keyword_id, app_id, 0)
+               for run_id, keyword_id, app_id in __missingPairs(checks=checks, stored=stored, app_ids=app_ids)]
+    return values
+
+
+def position_counts(data: QuerySet, tasks: QuerySet) -> dict[tuple[int, int], Counter[int]]:
+    """ Returns number of runs by position (position multiset) of every (keyword id, app id) pair of `data`
+    with one grouped query. Zero positions of the apps, that were checked in sparse runs, but are not stored,
+    are counted too.
+
+    Args:
+        data (QuerySet): `AppPositionScriptRunData` rows
+        tasks (QuerySet): `AppPositionScriptRunTask` of the same runs and keywords as `data`
+
+    Returns:
+        dict[tuple[int, int], Counter[int]]: positions by (keyword id, app id)
+    """
+    counts = defaultdict(Counter)
+    grouped = data.order_by().values("keyword_id", "app_id", "position").annotate(
+        count=Count("id")).values_list("keyword_id", "app_id", "position", "count")
+    for keyword_id, app_id, position, count in grouped:
+        counts[(keyword_id, app_id)][position] += count
+
+    checks = list(tasks.filter(checked_app_ids__isnull=False).values_list("run_id", "keyword_id", "checked_app_ids"))
+    if checks:
+        stored = set(data.filter(run_id__in={run_id for run_id, _, _ in checks}).values_list(
+            "run_id", "keyword_id", "app_id"))
+        for _, keyword_id, app_id in __missingPairs(checks=checks, stored=stored):
+            counts[(keyword_id, app_id)][0] += 1
+    return dict(counts)
+
+
+def with_missing_positions(data: QuerySet,
+                           tasks: QuerySet,
+                           app_ids: Collection[int] | None = None) -> list[models.AppPositionScriptRunData]:
+    """ Returns stored position rows and unsaved rows with zero position (and no id)
+    for the apps, that were checked in sparse runs, but are not stored. See `position_values`. """
+    rows = list(data.select_related("run"))
+    stored = {(row.run_id, row.keyword_id, row.app_id) for row in rows}
+    runs = {}
+    checks = []
+    for task in tasks.filter(checked_app_ids__isnull=False).select_related("run"):
+        runs[task.run_id] = task.run
+        checks.append((task.run_id, task.keyword_id, task.checked_app_ids))
+
+    rows += [models.AppPositionScriptRunData(run=runs[run_id], keyword_id=keyword_id, app_id=app_id)
+             for run_id, keyword_id, app_id in __missingPairs(checks=checks, stored=stored, app_ids=app_ids)]
+    return rows
+
+
+def last_positions(app_id: int, keyword_ids: Iterable[int]) -> dict[int, models.AppPositionScriptRunData]:
+    """ Returns the last position row of the app by keyword id. If the app was checked in a later
+    sparse run, but not found, unsaved row with zero position of that run is returned (see `with_missing_positions`).
+    Keywords, where the app was never checked, are absent. """
+    positions = {}
+    for keyword_id in keyword_ids:
+        data = models.AppPositionScriptRunData.objects.filter(app_id=app_id, keyword_id=keyword_id)
+        last = data.select_related("run").order_by("-run__started_at").first()
+        tasks = models.AppPositionScriptRunTask.objects.filter(keyword_id=keyword_id)
+        if last:
+            # only runs after the last stored row can hide a newer "not found"
+            data = data.filter(id=last.id)
+            tasks = tasks.filter(run__started_at__gt=last.run.started_at)
+
+        rows = with_missing_positions(data=data, tasks=tasks, app_ids=[app_id])
+        if rows:
+            positions[keyword_id] = max(rows, key=lambda row: row.run.started_at)
+    return positions
+
+
+def has_sparse_tasks(tasks: QuerySet) -> bool:
+    """ Returns True if some of `tasks` were written in sparse mode """
+    return tasks.filter(checked_app_ids__isnull=False).exists()
+
+
+def __missingPairs(checks: Iterable[tuple[int, int, list[int]]],
+                   stored: set[tuple[int, int, int]],
+                   app_ids: Collection[int] | None = None) -> Iterator[tuple[int, int, int]]:
+    """ Yields (run id, keyword id, app id) of the checked pairs, that are not `stored`
+
+    Args:
+        checks (Iterable[tuple[int, int, list[int]]]): run id, keyword id and checked app ids of sparse tasks
+        stored (set[tuple[int, int, int]]): (run id, keyword id, app id) of the stored rows
+        app_ids (Collection[int] | None, optional): apps to yield. Defaults to None (all apps).
+    """
+    app_ids = set(app_ids) if app_ids is not None else None
+    for run_id, keyword_id, checked_app_ids in checks:
+        for app_id in checked_app_ids:
+            if app_ids is not None and app_id not in app_ids:
+                continue
+            if (run_id, keyword_id, app_id) not in stored:
+                yield run_id, keyword_id, app_id
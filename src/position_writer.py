@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import queue
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, JSONField, Value, When
+from django.utils import timezone
+
+from src.serp_snapshots import PackageInterner, pack_ids
+from web.kwfinder import models
+from web.kwfinder.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PositionWriter:
+    """ Collects `AppPositionScriptRunData` rows from all scraper workers into a bounded buffer
+    and saves them with `bulk_create` in a background thread, when `batch_size` rows are
+    collected or `flush_interval` seconds passed. Keyword tasks of the run are marked as done
+    in the same transaction as their rows. Use it as a context manager: everything
+    that was added is flushed on exit, even if the run failed.
+
+    In `sparse` mode rows with zero position are not saved. Ids of all apps of the rows
+    are saved to the keyword task instead, so absent rows mean "not found" (see `position_store`).
+    Search page snapshots of the keywords are saved with their rows (see `serp_snapshots`). """
+
+    __STOP = object()
+
+    def __init__(self,
+                 run_id: int,
+                 batch_size: int | None = None,
+                 flush_interval: float | None = None,
+                 queue_size: int | None = None,
+                 sparse: bool | None = None) -> None:
+        self.run_id = run_id
+        self.sparse = settings.SPARSE_POSITIONS if sparse is None else sparse
+        self.batch_size = settings.POSITION_WRITER_BATCH_SIZE if batch_size is None else batch_size
+        self.flush_interval = settings.POSITION_WRITER_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.written = 0
+        self.not_stored = 0
+        self.snapshots = 0
+        self._interner = PackageInterner()
+
+        self._queue = queue.Queue(
+            maxsize=settings.POSITION_WRITER_QUEUE_SIZE if queue_size is None else queue_size)
+        self._thread = threading.Thread(
+            target=self.__run, name="position-writer", daemon=True)
+
+    def __enter__(self) -> "PositionWriter":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    def add(self,
+            rows: list[models.AppPositionScriptRunData],
+            keyword_id: int | None = None,
+            snapshot: list[str] | None = None):
+        """ Adds rows to the buffer. Blocks while the buffer is full.
+
+        Args:
+            rows (list[models.AppPositionScriptRunData]): position rows
+            keyword_id (int | None, optional): id of the keyword, whose task is done with these rows.
+                Defaults to None.
+            snapshot (list[str] | None, optional): package ids of the keyword search page top
+                (see `snapshot_package_ids`). Defaults to None (not stored).
+        """
+        item = self.__item(rows=rows, keyword_id=keyword_id, snapshot=snapshot)
+        if item:
+            self._queue.put(item)
+
+    async def addAsync(self,
+                       rows: list[models.AppPositionScriptRunData],
+                       keyword_id: int | None = None,
+                       snapshot: list[str] | None = None):
+        """ Adds rows to the buffer from event loop. While the buffer is full waits without blocking the loop.
+        See `add`. """
+        item = self.__item(rows=rows, keyword_id=keyword_id, snapshot=snapshot)
+        if item:
+            await self.__putAsync(item)
+
+    def fail(self, keyword_id: int):
+        """ Marks keyword task as failed """
+        self._queue.put(([], keyword_id, models.AppPositionScriptRunTask.FAILED, None, None))
+
+    async def failAsync(self, keyword_id: int):
+        """ Marks keyword task as failed from event loop """
+        await self.__putAsync(([], keyword_id, models.AppPositionScriptRunTask.FAILED, None, None))
+
+    def __item(self,
+               rows: list[models.AppPositionScriptRunData],
+               keyword_id: int | None,
+               snapshot: list[str] | None) -> tuple | None:
+        """ Returns buffer item of the rows. None if there is nothing to save. """
+        if not rows and not keyword_id:
+            return None
+
+        checked_app_ids = None
+        if self.sparse and rows:
+            checked_app_ids = [row.app_id for row in rows]
+            rows = [row for row in rows if row.position]
+            self.not_stored += len(checked_app_ids) - len(rows)
+        return rows, keyword_id, models.AppPositionScriptRunTask.DONE, checked_app_ids, snapshot
+
+    async def __putAsync(self, item: tuple):
+        """ Puts `item` to the buffer. If the buffer is full, waits for a free place in executor thread """
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, self._queue.put, item)
+
+    def close(self):
+        """ Flushes all added rows and stops background thread """
+        self._queue.put(self.__STOP)
+        self._thread.join()
+        logger.info(
+            f"Position writer is closed. {self.written} rows written"
+            + (f", {self.not_stored} zero positions are not stored" if self.sparse else "")
+            + (f", {self.snapshots} search page snapshots written." if self.snapshots else "."))
+
+    def __run(self):
+        batch = self.__Batch()
+        deadline = monotonic() + self.flush_interval
+        stop = False
+
+        while not stop:
+            try:
+                item = self._queue.get(
+                    timeout=max(0, deadline - monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is self.__STOP:
+                stop = True
+            elif item:
+                batch.add(*item)
+
+            if (stop or len(batch.rows) >= self.batch_size or len(batch.checked_app_ids) >= self.batch_size
+                    or len(batch.snapshots) >= self.batch_size or monotonic() >= deadline):
+                if not self.__flush(batch, last=stop):
+                    batch = self.__Batch()
+                deadline = monotonic() + self.flush_interval
+
+        connection.close()
+
+    class __Batch:
+        def __init__(self) -> None:
+            self.rows: list[models.AppPositionScriptRunData] = []
+            self.keyword_ids: dict[int, list[int]] = {}
+            self.checked_app_ids: dict[int, list[int]] = {}
+            self.snapshots: dict[int, list[str]] = {}
+
+        def add(self,
+                rows: list[models.AppPositionScriptRunData],
+                keyword_id: int | None,
+                state: int,
+                checked_app_ids: list[int] | None,
+                snapshot: list[str] | None):
+            self.rows.extend(rows)
+            if keyword_id:
+                self.keyword_ids.setdefault(state, []).append(keyword_id)
+                if checked_app_ids:
+                    self.checked_app_ids[keyword_id] = checked_app_ids
+                if snapshot:
+                    self.snapshots[keyword_id] = snapshot
+
+        def fail(self, keyword_ids: set[int]):
+            """ Moves tasks of `keyword_ids` to failed state and drops their checked apps and snapshots """
+            for state in list(self.keyword_ids):
+                self.keyword_ids[state] = [
+                    keyword_id for keyword_id in self.keyword_ids[state] if keyword_id not in keyword_ids]
+            self.keyword_ids.setdefault(models.AppPositionScriptRunTask.FAILED, []).extend(keyword_ids)
+            for keyword_id in keyword_ids:
+                self.checked_app_ids.pop(keyword_id, None)
+                self.snapshots.pop(keyword_id, None)
+
+        def __bool__(self):
+            return bool(self.rows or self.keyword_ids)
+
+    def __flush(self, batch: "__Batch", last: bool = False) -> bool:
+        """ Saves `batch` to database
+
+        Returns:
+            bool: True if batch is not saved and should be flushed again
+        """
+        if not batch:
+            return False
+
+        try:
+            self.__save(batch)
+            self.written += len(batch.rows)
+            self.snapshots += len(batch.snapshots)
+            logger.debug(f"Flushed {len(batch.rows)} position rows.")
+            return False
+
+        except Exception as e:
+            logger.exception(e)
+            if not last:
+                logger.warning(
+                    f"Failed to flush {len(batch.rows)} position rows. They will be flushed with the next batch.")
+                return True
+
+        logger.warning(
+            f"Failed to flush {len(batch.rows)} position rows at once. Saving them one by one.")
+        lost_keyword_ids = set()
+        for row in batch.rows:
+            try:
+                row.save()
+                self.written += 1
+            except Exception as e:
+                logger.exception(e)
+                logger.error(f"Position row {row.run_id}/{row.keyword_id}/{row.app_id} is lost!")
+                lost_keyword_ids.add(row.keyword_id)
+
+        # keywords with lost rows are failed, so they are not taken for complete
+        if lost_keyword_ids:
+            batch.fail(lost_keyword_ids)
+        try:
+            package_ids = self.__internPackages(batch)
+            with transaction.atomic():
+                self.__saveTasks(batch, package_ids=package_ids)
+            self.snapshots += len(batch.snapshots)
+        except Exception as e:
+            logger.exception(e)
+            logger.error(
+                f"States of {sum(map(len, batch.keyword_ids.values()))} keyword tasks are not saved. "
+                "They stay pending and are processed again, if the run is resumed.")
+        return False
+
+    def __save(self, batch: "__Batch"):
+        package_ids = self.__internPackages(batch)
+        with metrics.DB_WRITE_DURATION.time(), transaction.atomic():
+            models.AppPositionScriptRunData.objects.bulk_create(
+                batch.rows, batch_size=self.batch_size)
+            self.__saveTasks(batch, package_ids=package_ids)
+
+    def __internPackages(self, batch: "__Batch") -> dict[str, int]:
+        # packages are interned before the transaction, so its rollback doesn't invalidate cached ids
+        return self._interner.intern(
+            package_id for snapshot in batch.snapshots.values() for package_id in snapshot)
+
+    def __saveTasks(self, batch: "__Batch", package_ids: dict[str, int]):
+        """ Saves search page snapshots, states and checked apps of the keyword tasks of `batch` """
+        models.SerpSnapshot.objects.bulk_create([
+            models.SerpSnapshot(
+                run_id=self.run_id, keyword_id=keyword_id,
+                package_ids=pack_ids(package_ids[package_id] for package_id in snapshot))
+            for keyword_id, snapshot in batch.snapshots.items()
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+
+        for state, keyword_ids in batch.keyword_ids.items():
+            models.AppPositionScriptRunTask.objects.filter(
+                run_id=self.run_id, keyword_id__in=keyword_ids
+            ).update(state=state, finished_at=timezone.now())
+
+        if batch.checked_app_ids:
+            models.AppPositionScriptRunTask.objects.filter(
+                run_id=self.run_id, keyword_id__in=list(batch.checked_app_ids)
+            ).update(checked_app_ids=Case(
+                *(When(keyword_id=keyword_id, then=Value(app_ids, output_field=JSONField()))
+                  for keyword_id, app_ids in batch.checked_app_ids.items()),
+                output_field=JSONField()))
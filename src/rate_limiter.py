@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+from time import monotonic, sleep
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """ Token bucket, whose rate (requests per second) adapts to responses:
+    it grows by `increase` after every healthy response and is multiplied by `backoff`
+    on throttling signals (429, captcha, empty results), but not more often than once
+    in `backoff_interval` seconds, so one burst of failures is one back off. """
+
+    def __init__(self,
+                 name: str,
+                 rate: float | None = None,
+                 min_rate: float | None = None,
+                 max_rate: float | None = None,
+                 increase: float | None = None,
+                 backoff: float | None = None,
+                 backoff_interval: float = 1.0) -> None:
+        self.name = name
+        self.min_rate = settings.RATE_LIMIT_MIN if min_rate is None else min_rate
+        self.max_rate = settings.RATE_LIMIT_MAX if max_rate is None else max_rate
+        self.increase = settings.RATE_LIMIT_INCREASE if increase is None else increase
+        self.backoff = settings.RATE_LIMIT_BACKOFF if backoff is None else backoff
+        self.backoff_interval = backoff_interval
+
+        self._rate = settings.RATE_LIMIT_INITIAL if rate is None else rate
+        self._tokens = 1.0
+        self._updated_at = monotonic()
+        self._last_backoff_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """ Current rate in requests per second """
+        return self._rate
+
+    def reserve(self) -> float:
+        """ Takes a token from the bucket
+
+        Returns:
+            float: seconds to wait before the request can be made
+        """
+        with self._lock:
+            now = monotonic()
+            burst = max(1.0, self._rate)
+            self._tokens = min(burst, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    def acquire(self):
+        """ Blocks until the request can be made """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            sleep(wait_time)
+
+    async def acquireAsync(self):
+        """ Waits in event loop until the request can be made """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+    def success(self):
+        """ Healthy response: raises the rate """
+        with self._lock:
+            self._rate = min(self.max_rate, self._rate + self.increase)
+
+    def throttled(self, reason: str = ""):
+        """ Throttling signal: lowers the rate """
+        with self._lock:
+            now = monotonic()
+            if now - self._last_backoff_at < self.backoff_interval:
+                return
+
+            self._last_backoff_at = now
+            self._rate = max(self.min_rate, self._rate * self.backoff)
+            logger.warning(
+                f"Rate limiter {self.name} backed off to {self._rate:.2f} requests/s. Reason: {reason}")
+
+
+__limiters: dict[str, AdaptiveRateLimiter] = {}
+__limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint: str) -> AdaptiveRateLimiter:
+    """ Returns rate limiter of the proxy `endpoint`. All workers that use
+    the same endpoint share one limiter.
+
+    Args:
+        endpoint (str): proxy endpoint (see `safe_proxy_repr`)
+
+    Returns:
+        AdaptiveRateLimiter: limiter
+    """
+    with __limiters_lock:
+        if endpoint not in __limiters:
+            __limiters[endpoint] = AdaptiveRateLimiter(name=endpoint)
+        return __limiters[endpoint]
+
+
+def rates_repr() -> str:
+    """ Returns human readable current rates of all limiters """
+    with __limiters_lock:
+        limiters = list(__limiters.values())
+    if len(limiters) == 1:
+        return f"Rate {limiters[0].rate:.2f} requests/s"
+    return "Rate " + ", ".join(f"{limiter.name} {limiter.rate:.2f}" for limiter in limiters) + " requests/s"
@@ -0,0 +1,130 @@
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from src.links import getGoogleBaseUrl
+from web.kwfinder import models
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ORDERS = 0  # keywords of apps with active ASO World orders
+PRIORITY_REVENUE = 1  # keywords of apps with recent keitaro revenue
+PRIORITY_REST = 2
+
+
+@dataclass(frozen=True)
+class KeywordPlan:
+    """ Everything the scraper needs to process one keyword without database reads """
+    keyword_id: int
+    query: str
+    region_code: str
+    store_attributes: str
+    apps: tuple[tuple[int, str], ...]  # (app id, package id) pairs to locate
+    base_url: str
+    priority: int = PRIORITY_REST
+
+    def __str__(self):
+        return f"[{self.region_code}] {self.query}"
+
+
+def build_run_plan() -> tuple[KeywordPlan, ...]:
+    """ Builds plan of the position run for all keywords, that are connected to active apps,
+    with a few queries. Keywords are ordered by priority tiers: keywords with active
+    ASO World orders first, then keywords of apps with recent keitaro revenue, then the rest.
+
+    Returns:
+        tuple[KeywordPlan, ...]: plans of keywords
+    """
+    base_url = getGoogleBaseUrl()
+
+    apps_by_keyword = defaultdict(list)
+    relations = models.App.keywords.through.objects.filter(
+        app__is_active=True
+    ).values_list("keyword_id", "app_id", "app__package_id").order_by("keyword_id", "app_id")
+    for keyword_id, app_id, package_id in relations:
+        apps_by_keyword[keyword_id].append((app_id, package_id))
+
+    keywords = models.Keyword.objects.filter(
+        id__in=models.App.keywords.through.objects.filter(
+            app__is_active=True).values("keyword_id")
+    ).values_list("id", "name", "region__code", "region__google_store_link_attributes").order_by("id")
+
+    order_keyword_ids, order_app_ids = __getActiveOrders()
+    revenue_app_ids = __getAppsWithRevenue()
+
+    plan = []
+    for keyword_id, name, region_code, store_attributes in keywords:
+        if not store_attributes:
+            logger.warning(
+                f"Keyword [{region_code}] {name} doesn't contain Google play market attributes!")
+            continue
+
+        app_ids = {app_id for app_id, _ in apps_by_keyword[keyword_id]}
+        if keyword_id in order_keyword_ids or app_ids & order_app_ids:
+            priority = PRIORITY_ORDERS
+        elif app_ids & revenue_app_ids:
+            priority = PRIORITY_REVENUE
+        else:
+            priority = PRIORITY_REST
+
+        plan.append(KeywordPlan(
+            keyword_id=keyword_id,
+            query=name,
+            region_code=region_code,
+            store_attributes=store_attributes,
+            apps=tuple(apps_by_keyword[keyword_id]),
+            base_url=base_url,
+            priority=priority,
+        ))
+
+    plan.sort(key=lambda keyword: keyword.priority)
+    tiers = Counter(keyword.priority for keyword in plan)
+    logger.info(
+        f"Run plan is built: {len(plan)} keywords ({tiers[PRIORITY_ORDERS]} with active orders, "
+        f"{tiers[PRIORITY_REVENUE]} with keitaro revenue), {sum(len(p.apps) for p in plan)} apps to locate.")
+    return tuple(plan)
+
+
+def tracked_package_ids(plan: tuple[KeywordPlan, ...]) -> dict[tuple[str, str], frozenset[str]]:
+    """ Returns package ids, whose positions are needed, by search (query, store attributes).
+    Keywords with the same search share one download, so their apps are joined.
+    Streamed downloads can stop once these apps are found. Results of such downloads are not
+    complete, so they can be used only if search results are not shared with other runs
+    (`settings.SERP_CACHE_PERSIST_TTL` is 0) and are not stored as snapshots (`settings.SERP_SNAPSHOTS`),
+    otherwise empty dict is returned.
+
+    Args:
+        plan (tuple[KeywordPlan, ...]): run plan
+
+    Returns:
+        dict[tuple[str, str], frozenset[str]]: package ids by (query, store attributes)
+    """
+    if not settings.SERP_STREAMING or settings.SERP_CACHE_PERSIST_TTL or settings.SERP_SNAPSHOTS:
+        return {}
+
+    package_ids = defaultdict(set)
+    for keyword in plan:
+        package_ids[(keyword.query, keyword.store_attributes)].update(
+            package_id for _, package_id in keyword.apps)
+    return {search: frozenset(ids) for search, ids in package_ids.items()}
+
+
+def __getActiveOrders() -> tuple[set[int], set[int]]:
+    """ Returns ids of keywords and apps with active ASO World orders """
+    orders = models.ASOWorldOrder.objects.filter(state=models.ASOWorldOrder.ACTIVE)
+    keyword_ids = set(models.ASOWorldOrderKeywordData.objects.filter(
+        order__in=orders).values_list("keyword_id", flat=True).distinct())
+    app_ids = set(orders.values_list("app_id", flat=True).distinct())
+    return keyword_ids, app_ids
+
+
+def __getAppsWithRevenue() -> set[int]:
+    """ Returns ids of apps with keitaro revenue in the last `settings.KEITARO_PRIORITY_DAYS` days """
+    return set(models.KeitaroDailyAppData.objects.filter(
+        revenue__gt=0,
+        date__gte=timezone.now().date() - timedelta(days=settings.KEITARO_PRIORITY_DAYS),
+    ).values_list("app_id", flat=True).distinct())
@@ -0,0 +1,156 @@
+import logging
+from time import monotonic
+
+from django.conf import settings
+from django.utils import timezone
+
+from src.run_plan import KeywordPlan, build_run_plan
+from src.scrape_schedule import split_plan_by_volatility
+from web.kwfinder import models
+
+logger = logging.getLogger(__name__)
+
+
+def start_run(resume: bool = False,
+              run_id: int | None = None,
+              adaptive: bool = False) -> tuple[models.AppPositionScriptRun, tuple[KeywordPlan, ...]] | None:
+    """ Creates new position run with a task for every keyword of the plan, or resumes unfinished one.
+
+    Args:
+        resume (bool, optional): resume unfinished run instead of creating new one. Defaults to False.
+        run_id (int | None, optional): id of the run to resume. If None, the last unfinished run
+            is resumed. Defaults to None.
+        adaptive (bool, optional): skip stable keywords (see `split_plan_by_volatility`). Their last known
+            positions are saved to the new run as skipped. Defaults to False.
+
+    Returns:
+        tuple[models.AppPositionScriptRun, tuple[KeywordPlan, ...]] | None: run and plan of keywords
+            that are left to process. None if there is no run to resume.
+    """
+    plan = build_run_plan()
+
+    if resume:
+        return __resumeRun(plan=plan, run_id=run_id)
+
+    skipped = {}
+    if adaptive:
+        plan, skipped = split_plan_by_volatility(plan)
+
+    run = models.AppPositionScriptRun()
+    run.save()
+    models.AppPositionScriptRunTask.objects.bulk_create([
+        models.AppPositionScriptRunTask(run=run, keyword_id=keyword.keyword_id)
+        for keyword in plan
+    ] + [
+        models.AppPositionScriptRunTask(
+            run=run, keyword_id=keyword_id, state=models.AppPositionScriptRunTask.DONE, finished_at=run.started_at)
+        for keyword_id in skipped
+    ], batch_size=1000)
+    models.AppPositionScriptRunData.objects.bulk_create([
+        models.AppPositionScriptRunData(
+            run=run, keyword_id=keyword_id, app_id=app_id, position=position, is_skipped=True)
+        for keyword_id, positions in skipped.items()
+        for app_id, position in positions.items()
+    ], batch_size=1000)
+
+    logger.info(f"Run {run.id} is started with {len(plan)} keywords.")
+    return run, plan
+
+
+def join_run(run_id: int | None = None) -> tuple[models.AppPositionScriptRun, tuple[KeywordPlan, ...]] | None:
+    """ Returns unfinished run for a worker process and plan of all its keywords.
+    Worker claims keywords of the plan from the run's tasks.
+
+    Args:
+        run_id (int | None, optional): id of the run to join. If None, the last unfinished run
+            is joined. Defaults to None.
+
+    Returns:
+        tuple[models.AppPositionScriptRun, tuple[KeywordPlan, ...]] | None: run and plan.
+            None if there is no run to join.
+    """
+    run = __findUnfinishedRun(run_id=run_id)
+    if not run:
+        return None
+
+    logger.info(f"Joining run {run.id}. {progress_repr(run)}")
+    return run, build_run_plan()
+
+
+def finish_run_if_done(run: models.AppPositionScriptRun) -> bool:
+    """ Marks run as ended if all its keyword tasks are processed. Run with pending tasks
+    (left by other workers or by the time budget) stays unfinished, so it can be resumed or joined.
+    Only one of the workers, that finish at the same time, ends the run.
+
+    Returns:
+        bool: True if run is finished by this call
+    """
+    pending = run.apppositionscriptruntask_set.filter(  # type: ignore
+        state=models.AppPositionScriptRunTask.PENDING).count()
+    if pending:
+        logger.info(f"Run {run.id} has {pending} keywords left. It stays unfinished. {progress_repr(run)}")
+        return False
+
+    finished = models.AppPositionScriptRun.objects.filter(
+        id=run.id, ended_at__isnull=True).update(ended_at=timezone.now())
+    if finished:
+        logger.info(f"Run {run.id} is finished. {progress_repr(run)}")
+    return bool(finished)
+
+
+def run_deadline(time_budget: float | None = None) -> float | None:
+    """ Returns `time.monotonic` deadline of the run, that is started now.
+
+    Args:
+        time_budget (float | None, optional): time budget of the run in seconds. 0 means unlimited.
+            Defaults to `settings.RUN_TIME_BUDGET`.
+
+    Returns:
+        float | None: deadline. None if time is not limited.
+    """
+    time_budget = settings.RUN_TIME_BUDGET if time_budget is None else time_budget
+    return monotonic() + time_budget if time_budget else None
+
+
+def progress_repr(run: models.AppPositionScriptRun) -> str:
+    """ Returns human readable progress of the run """
+    progress = run.progress
+    total = sum(progress.values())
+    done = progress[models.AppPositionScriptRunTask.DONE]
+    failed = progress[models.AppPositionScriptRunTask.FAILED]
+    return f"Done {done} out of {total} keywords, failed {failed}."
+
+
+def __resumeRun(plan: tuple[KeywordPlan, ...],
+                run_id: int | None = None) -> tuple[models.AppPositionScriptRun, tuple[KeywordPlan, ...]] | None:
+    """ Returns unfinished run and plan of its keywords that are not done yet """
+    run = __findUnfinishedRun(run_id=run_id)
+    if not run:
+        return None
+
+    tasks = models.AppPositionScriptRunTask.objects.filter(
+        run=run).exclude(state=models.AppPositionScriptRunTask.DONE)
+    remaining = set(tasks.values_list("keyword_id", flat=True))
+
+    planned = {keyword.keyword_id for keyword in plan}
+    unknown = tasks.filter(state=models.AppPositionScriptRunTask.PENDING, keyword_id__in=remaining - planned).update(
+        state=models.AppPositionScriptRunTask.FAILED, finished_at=timezone.now())
+    if unknown:
+        logger.warning(
+            f"{unknown} tasks of run {run.id} are not in the run plan anymore. Marked them as failed.")
+
+    plan = tuple(keyword for keyword in plan if keyword.keyword_id in remaining)
+    logger.info(
+        f"Resuming run {run.id}. {progress_repr(run)} {len(plan)} keywords left to process.")
+    return run, plan
+
+
+def __findUnfinishedRun(run_id: int | None = None) -> models.AppPositionScriptRun | None:
+    """ Returns unfinished run with `run_id` or the last unfinished run """
+    runs = models.AppPositionScriptRun.objects.filter(ended_at__isnull=True)
+    run = runs.filter(id=run_id).first() if run_id else runs.order_by("-started_at").first()
+
+    if not run:
+        logger.error(
+            f"Can't find unfinished run{f' with id {run_id}' if run_id else ''}!")
+    return run
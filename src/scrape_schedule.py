@@ -0,0 +1,108 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from src.position_store import position_values
+from src.run_plan import KeywordPlan
+from web.kwfinder import models
+
+logger = logging.getLogger(__name__)
+
+
+def pair_volatility(positions: list[int]) -> float:
+    """ Returns volatility of (keyword, app) pair by its daily positions: the spread
+    of the positions. Moves in or out of the search results are infinitely volatile.
+
+    Args:
+        positions (list[int]): daily positions of the pair
+
+    Returns:
+        float: volatility score
+    """
+    if 0 in positions and any(positions):
+        return float("inf")
+
+    return max(positions) - min(positions)
+
+
+def split_plan_by_volatility(plan: tuple[KeywordPlan, ...]) -> tuple[tuple[KeywordPlan, ...], dict[int, dict[int, int]]]:
+    """ Splits run plan into keywords to scrape and stable keywords to skip. Google play returns
+    positions of all keyword apps at once, so a keyword is skipped only when all of its apps are stable:
+    - there are at least `settings.VOLATILITY_MIN_DAYS` daily positions in the last
+      `settings.VOLATILITY_WINDOW_DAYS` days and their volatility is not above `settings.VOLATILITY_THRESHOLD`;
+    - the keyword was scraped in the last `settings.STABLE_SCRAPE_INTERVAL` hours
+      and the app didn't move since the last daily position.
+
+    Args:
+        plan (tuple[KeywordPlan, ...]): run plan
+
+    Returns:
+        tuple[tuple[KeywordPlan, ...], dict[int, dict[int, int]]]: plan to scrape
+            and last known positions of skipped keywords by keyword id and app id
+    """
+    history = __getHistory()
+    scraped_keyword_ids, recent = __getRecentPositions()
+
+    to_scrape = []
+    skipped = {}
+    for keyword in plan:
+        positions = __getStablePositions(keyword=keyword, history=history, recent=recent)
+        if keyword.keyword_id in scraped_keyword_ids and positions is not None:
+            skipped[keyword.keyword_id] = positions
+        else:
+            to_scrape.append(keyword)
+
+    logger.info(
+        f"Adaptive schedule: {len(to_scrape)} keywords to scrape, {len(skipped)} stable keywords skipped.")
+    return tuple(to_scrape), skipped
+
+
+def __getStablePositions(keyword: KeywordPlan,
+                         history: dict[tuple[int, int], list[int]],
+                         recent: dict[tuple[int, int], set[int]]) -> dict[int, int] | None:
+    """ Returns last known positions of `keyword` apps by app id. None if any app is not stable. """
+    positions = {}
+    for app_id, _ in keyword.apps:
+        pair_history = history.get((keyword.keyword_id, app_id))
+        if not pair_history or len(pair_history) < settings.VOLATILITY_MIN_DAYS:
+            return None
+
+        if pair_volatility(pair_history) > settings.VOLATILITY_THRESHOLD:
+            return None
+
+        if recent.get((keyword.keyword_id, app_id), set()) - {pair_history[-1]}:
+            return None
+
+        positions[app_id] = pair_history[-1]
+    return positions
+
+
+def __getHistory() -> dict[tuple[int, int], list[int]]:
+    """ Returns daily positions of the last `settings.VOLATILITY_WINDOW_DAYS` days by (keyword id, app id) """
+    history = defaultdict(list)
+    data = models.DailyAggregatedPositionData.objects.filter(
+        date__gte=timezone.now().date() - timedelta(days=settings.VOLATILITY_WINDOW_DAYS),
+    ).values_list("keyword_id", "app_id", "position").order_by("date")
+
+    for keyword_id, app_id, position in data:
+        history[(keyword_id, app_id)].append(position)
+    return history
+
+
+def __getRecentPositions() -> tuple[set[int], dict[tuple[int, int], set[int]]]:
+    """ Returns ids of keywords, that were scraped in the last `settings.STABLE_SCRAPE_INTERVAL` hours,
+    and their scraped positions by (keyword id, app id) """
+    keyword_ids = set()
+    positions = defaultdict(set)
+    started_after = timezone.now() - timedelta(hours=settings.STABLE_SCRAPE_INTERVAL)
+    data = position_values(
+        data=models.AppPositionScriptRunData.objects.filter(run__started_at__gte=started_after, is_skipped=False),
+        tasks=models.AppPositionScriptRunTask.objects.filter(run__started_at__gte=started_after))
+
+    for _, keyword_id, app_id, position in data:
+        keyword_ids.add(keyword_id)
+        positions[(keyword_id, app_id)].add(position)
+    return keyword_ids, positions
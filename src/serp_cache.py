@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class SerpCache:
+    """ Thread safe LRU cache of parsed search results keyed by query and store attributes.
+    Entries live `ttl` seconds. If `persistent_ttl` is set, results are also shared between
+    runs through `settings.SERP_CACHE_ALIAS` django cache for `persistent_ttl` seconds. """
+
+    def __init__(self, max_size: int | None = None, ttl: float | None = None, persistent_ttl: int | None = None) -> None:
+        self.max_size = settings.SERP_CACHE_SIZE if max_size is None else max_size
+        self.ttl = settings.SERP_CACHE_TTL if ttl is None else ttl
+        self.persistent_ttl = settings.SERP_CACHE_PERSIST_TTL if persistent_ttl is None else persistent_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, tuple[float, list[str]]] = OrderedDict()
+        self._in_flight: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(keyword: str, attributes: str) -> str:
+        """ Returns cache key for the search query """
+        return hashlib.sha1(f"{keyword}\n{attributes}".encode()).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return 0.0 if total == 0 else self.hits / total
+
+    def summary(self) -> str:
+        return f"SERP cache: {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate:.1%}"
+
+    def get(self, keyword: str, attributes: str) -> list[str] | None:
+        """ Returns cached links for the query or None. Counts hit or miss. """
+        key = self.key(keyword=keyword, attributes=attributes)
+        with self._lock:
+            links = self.__get(key)
+            if links is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return links
+
+    def set(self, keyword: str, attributes: str, links: list[str]):
+        """ Saves links for the query. Empty results are not cached. """
+        if not links:
+            return
+
+        key = self.key(keyword=keyword, attributes=attributes)
+        with self._lock:
+            self.__set(key, links)
+
+    def getOrFetch(self, keyword: str, attributes: str, fetch: Callable[[], list[str]]) -> list[str]:
+        """ Returns cached links for the query or fetches them with `fetch`.
+        If the same query is being fetched by another thread, waits for its result.
+
+        Args:
+            keyword (str): search query
+            attributes (str): store link attributes
+            fetch (Callable[[], list[str]]): function that loads links
+
+        Returns:
+            list[str]: links
+        """
+        key = self.key(keyword=keyword, attributes=attributes)
+
+        while True:
+            with self._lock:
+                links = self.__get(key)
+                if links is not None:
+                    self.hits += 1
+                    return links
+
+                event = self._in_flight.get(key)
+                if not event:
+                    self.misses += 1
+                    event = threading.Event()
+                    self._in_flight[key] = event
+                    break
+
+            event.wait()
+
+        try:
+            links = fetch()
+            with self._lock:
+                self.__set(key, links)
+            return links
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def __get(self, key: str) -> list[str] | None:
+        entry = self._entries.get(key)
+        if entry and entry[0] > monotonic():
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        if entry:
+            del self._entries[key]
+
+        if self.persistent_ttl:
+            links = caches[settings.SERP_CACHE_ALIAS].get(key)
+            if links:
+                self.__setLocal(key, links)
+                return links
+
+        return None
+
+    def __set(self, key: str, links: list[str]):
+        if not links:
+            return
+
+        self.__setLocal(key, links)
+        if self.persistent_ttl:
+            caches[settings.SERP_CACHE_ALIAS].set(
+                key, links, timeout=self.persistent_ttl)
+
+    def __setLocal(self, key: str, links: list[str]):
+        self._entries[key] = (monotonic() + self.ttl, links)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
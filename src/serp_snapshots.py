@@ -0,0 +1,114 @@
+import sys
+import threading
+from array import array
+from datetime import datetime
+from typing import Iterable, List
+
+from django.conf import settings
+
+from web.kwfinder import models
+from web.kwfinder.services.link_extractors import package_id_from_link
+
+NOT_APP = 0  # id of the links, that are not app links
+
+
+def snapshot_package_ids(links: List[str], size: int | None = None) -> list[str]:
+    """ Returns package ids of the top `size` links in their order ("" for the links, that are not app links)
+
+    Args:
+        links (List[str]): links from store search page
+        size (int | None, optional): number of links. Defaults to `settings.SERP_SNAPSHOT_SIZE`.
+
+    Returns:
+        list[str]: package ids by position
+    """
+    size = settings.SERP_SNAPSHOT_SIZE if size is None else size
+    return [package_id_from_link(link) or "" for link in links[:size]]
+
+
+def pack_ids(ids: Iterable[int]) -> bytes:
+    """ Packs ids to uint32 little-endian array """
+    packed = array("I", ids)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_ids(data: bytes) -> list[int]:
+    """ Unpacks ids from uint32 little-endian array (see `pack_ids`) """
+    packed = array("I")
+    packed.frombytes(bytes(data))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tolist()
+
+
+class PackageInterner:
+    """ Maps package ids to the ids of `StorePackage` dictionary table. Unknown packages are added to the table.
+    Known ids are cached, so the table is queried only for new packages. """
+
+    def __init__(self) -> None:
+        self._ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def intern(self, package_ids: Iterable[str]) -> dict[str, int]:
+        """ Returns `StorePackage` ids by package id. Must not be called in a transaction, that can be
+        rolled back, otherwise ids of the rolled back rows are cached.
+
+        Args:
+            package_ids (Iterable[str]): package ids, "" is mapped to `NOT_APP`
+
+        Returns:
+            dict[str, int]: ids by package id
+        """
+        package_ids = set(package_ids)
+        with self._lock:
+            unknown = {package_id for package_id in package_ids if package_id and package_id not in self._ids}
+            if unknown:
+                self._ids.update(self.__load(unknown))
+            missing = unknown - self._ids.keys()
+            if missing:
+                models.StorePackage.objects.bulk_create(
+                    [models.StorePackage(package_id=package_id) for package_id in missing],
+                    batch_size=1000, ignore_conflicts=True)
+                self._ids.update(self.__load(missing))
+            return {package_id: self._ids.get(package_id, NOT_APP) for package_id in package_ids}
+
+    @staticmethod
+    def __load(package_ids: set[str]) -> dict[str, int]:
+        return dict(models.StorePackage.objects.filter(
+            package_id__in=package_ids).values_list("package_id", "id"))
+
+
+def package_rank_history(package_id: str,
+                         keyword_ids: Iterable[int] | None = None,
+                         started_after: datetime | None = None) -> dict[int, list[tuple[datetime, int]]]:
+    """ Returns positions of any store app (e.g. competitor's) from the stored search page snapshots
+    without new requests. Position is 0 if app is not in the top of the snapshot.
+
+    Args:
+        package_id (str): package id of the app
+        keyword_ids (Iterable[int] | None, optional): keywords to check. Defaults to None (all keywords).
+        started_after (datetime | None, optional): runs to check. Defaults to None (all runs).
+
+    Returns:
+        dict[int, list[tuple[datetime, int]]]: (run start, position) ordered by run start by keyword id
+    """
+    package = models.StorePackage.objects.filter(package_id=package_id).first()
+    if not package:
+        return {}
+
+    snapshots = models.SerpSnapshot.objects.all()
+    if keyword_ids is not None:
+        snapshots = snapshots.filter(keyword_id__in=list(keyword_ids))
+    if started_after:
+        snapshots = snapshots.filter(run__started_at__gte=started_after)
+
+    history = {}
+    for keyword_id, started_at, data in snapshots.order_by("run__started_at").values_list(
+            "keyword_id", "run__started_at", "package_ids").iterator(chunk_size=1000):
+        ids = unpack_ids(data)
+        position = ids.index(package.id) + 1 if package.id in ids else 0
+        history.setdefault(keyword_id, []).append((started_at, position))
+    return history
+
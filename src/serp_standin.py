@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import sleep
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+def fixture_key(url: str) -> str:
+    """ Returns fixture key of the search page `url`: hash of its sorted query parameters,
+    so the same search is found regardless of the host and parameters order """
+    params = sorted(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    return hashlib.sha1("&".join(f"{name}={value}" for name, value in params).encode()).hexdigest()
+
+
+class SerpFixtureStore:
+    """ Directory of recorded store search pages. Page of the search is saved
+    to `<fixture_key>.html`, so the directory can also be used by `benchmark_link_extractors` """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._keys = sorted(path.stem for path in self.path.glob("*.html"))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def save(self, url: str, html: str):
+        """ Saves search page `html` of the `url` """
+        self.path.mkdir(parents=True, exist_ok=True)
+        key = fixture_key(url)
+        (self.path / f"{key}.html").write_text(html, encoding="utf-8")
+        if key not in self._keys:
+            self._keys.append(key)
+
+    def load(self, url: str) -> str | None:
+        """ Returns recorded page of the `url`. Searches, that are not recorded, get one of
+        the recorded pages, the same for the same search. None if store is empty. """
+        if not self._keys:
+            return None
+
+        key = fixture_key(url)
+        path = self.path / f"{key}.html"
+        if not path.exists():
+            path = self.path / f"{self._keys[int(key, 16) % len(self._keys)]}.html"
+        return path.read_text(encoding="utf-8")
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """ Serves recorded search pages. Works as a web server and as a plain HTTP proxy
+    (requests with absolute urls), so scrapers can use it both as the store and as their proxy. """
+
+    protocol_version = "HTTP/1.1"
+    server: "StandInServer"
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency * random.uniform(0.5, 1.5)
+        if delay:
+            sleep(delay)
+
+        if random.random() < server.error_rate:
+            self.close_connection = True
+            return
+
+        if random.random() < server.throttle_rate:
+            self.__respond(429, "Too many requests")
+            return
+
+        if "/store/search" not in urlsplit(self.path).path:
+            self.__respond(200, "OK")
+            return
+
+        html = server.store.load(self.path)
+        if html is None:
+            self.__respond(404, "No recorded pages")
+            return
+
+        self.__respond(200, html)
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"Stand-in: {format % args}")
+
+    def __respond(self, status: int, body: str):
+        content = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """ Local stand-in of the Google Play search with configurable latency (mean seconds),
+    rate of dropped connections and rate of 429 responses """
+
+    daemon_threads = True
+
+    def __init__(self,
+                 store: SerpFixtureStore,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 throttle_rate: float = 0.0) -> None:
+        super().__init__((host, port), StandInRequestHandler)
+        self.store = store
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve_standin(fixtures_dir: str, port: int, latency: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0):
+    """ Serves stand-in on `port` until the process is stopped """
+    server = StandInServer(
+        store=SerpFixtureStore(fixtures_dir), port=port,
+        latency=latency, error_rate=error_rate, throttle_rate=throttle_rate)
+    logger.info(f"Stand-in is serving {len(server.store)} recorded pages on {server.url}")
+    server.serve_forever()
@@ -9,6 +9,7 @@ from django.utils.datastructures import MultiValueDictKeyError
 
 from src.apps_state import check_app
 from src.asoworld import add_app_to_asoworld, add_keyword_to_app_in_asoworld
+from src.position_store import last_positions
 from web.kwfinder import models, serializers
 from web.kwfinder.services.proxy.mobile_proxy import MobileProxy
 from web.kwfinder.services.proxy.simple_proxy import (
@@ -228,11 +229,8 @@ def app_keywords(request, app_id: int):
     app = get_object_or_404(models.App, pk=app_id)
 
     keywords = app.keywords.all().order_by("region", "name")
-    positions = {
-        keyword: keyword.apppositionscriptrundata_set.filter(
-            app=app).order_by("-run__started_at").first()
-        for keyword in keywords
-    }
+    last = last_positions(app_id=app.id, keyword_ids=[keyword.id for keyword in keywords])
+    positions = {keyword: last.get(keyword.id) for keyword in keywords}
     return render(request, "apps/keywords/keywords.html", {"app": app, "positions": positions})
 
 
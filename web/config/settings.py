@@ -110,6 +110,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'serp': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'output', 'serp_cache'),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -165,10 +179,55 @@ MEDIA_URL = os.getenv('MEDIA_URL')
 
 
 DRIVER_PATH = os.getenv('DRIVER_PATH', 'driver/chromedriver')
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', '2'))
+DRIVER_MAX_PAGES = int(os.getenv('DRIVER_MAX_PAGES', '100'))  # 0 - no limit
+DRIVER_MAX_MEMORY_MB = int(os.getenv('DRIVER_MAX_MEMORY_MB', '1024'))  # 0 - no limit
 TIME_TO_SLEEP = float(os.getenv('TIME_TO_SLEEP', '1'))
 NUMBER_OF_THREADS = int(os.getenv('NUMBER_OF_THREADS', '1'))
 IS_HEADLESS_MODE = bool(int(os.getenv('IS_HEADLESS_MODE', '1')))
 TIMEOUT_TIME = int(os.getenv('TIMEOUT_TIME', '15'))
+KEYWORD_MAX_ATTEMPTS = int(os.getenv('KEYWORD_MAX_ATTEMPTS', '3'))
+KEYWORD_RETRY_DELAY = float(os.getenv('KEYWORD_RETRY_DELAY', '60'))
+PROXY_POOL_SIZE = int(os.getenv('PROXY_POOL_SIZE', '10'))
+PROXY_HEALTH_CHECK_INTERVAL = float(os.getenv('PROXY_HEALTH_CHECK_INTERVAL', '300'))
+STORE_TRANSPORT = os.getenv('STORE_TRANSPORT', 'http1')  # http1 (requests) or http2 (httpx)
+PROXY_MAX_FAILURES = int(os.getenv('PROXY_MAX_FAILURES', '3'))
+PROXY_COOLDOWN = float(os.getenv('PROXY_COOLDOWN', '60'))
+BLOCK_EMPTY_RESULTS = int(os.getenv('BLOCK_EMPTY_RESULTS', '3'))
+LINK_EXTRACTOR = os.getenv('LINK_EXTRACTOR', 'scanner')
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', '0'))  # 0 - parse search pages in scraper threads
+SERP_STREAMING = os.getenv('SERP_STREAMING', '0') == '1'
+SERP_STREAM_CHUNK_SIZE = int(os.getenv('SERP_STREAM_CHUNK_SIZE', '16384'))
+SERP_RESULTS_END_MARKER = os.getenv('SERP_RESULTS_END_MARKER', '')
+SERP_CACHE_SIZE = int(os.getenv('SERP_CACHE_SIZE', '10000'))
+SERP_CACHE_TTL = float(os.getenv('SERP_CACHE_TTL', '3600'))
+SERP_CACHE_PERSIST_TTL = int(os.getenv('SERP_CACHE_PERSIST_TTL', '0'))
+SERP_CACHE_ALIAS = 'serp'
+POSITION_WRITER_BATCH_SIZE = int(os.getenv('POSITION_WRITER_BATCH_SIZE', '500'))
+POSITION_WRITER_FLUSH_INTERVAL = float(os.getenv('POSITION_WRITER_FLUSH_INTERVAL', '5'))
+POSITION_WRITER_QUEUE_SIZE = int(os.getenv('POSITION_WRITER_QUEUE_SIZE', '1000'))
+SPARSE_POSITIONS = os.getenv('SPARSE_POSITIONS', '0') == '1'  # store only found apps' positions
+SERP_SNAPSHOTS = os.getenv('SERP_SNAPSHOTS', '0') == '1'  # store top of every search page
+SERP_SNAPSHOT_SIZE = int(os.getenv('SERP_SNAPSHOT_SIZE', '50'))
+RATE_LIMIT_INITIAL = float(os.getenv('RATE_LIMIT_INITIAL', '2'))
+RATE_LIMIT_MIN = float(os.getenv('RATE_LIMIT_MIN', '0.1'))
+RATE_LIMIT_MAX = float(os.getenv('RATE_LIMIT_MAX', '20'))
+RATE_LIMIT_INCREASE = float(os.getenv('RATE_LIMIT_INCREASE', '0.1'))
+RATE_LIMIT_BACKOFF = float(os.getenv('RATE_LIMIT_BACKOFF', '0.5'))
+WORKER_CLAIM_BATCH_SIZE = int(os.getenv('WORKER_CLAIM_BATCH_SIZE', '20'))
+WORKER_CLAIM_TIMEOUT = float(os.getenv('WORKER_CLAIM_TIMEOUT', '600'))
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', '10'))
+VOLATILITY_WINDOW_DAYS = int(os.getenv('VOLATILITY_WINDOW_DAYS', '14'))
+VOLATILITY_MIN_DAYS = int(os.getenv('VOLATILITY_MIN_DAYS', '7'))
+VOLATILITY_THRESHOLD = float(os.getenv('VOLATILITY_THRESHOLD', '0'))
+STABLE_SCRAPE_INTERVAL = float(os.getenv('STABLE_SCRAPE_INTERVAL', '24'))
+KEITARO_PRIORITY_DAYS = int(os.getenv('KEITARO_PRIORITY_DAYS', '7'))
+RUN_TIME_BUDGET = float(os.getenv('RUN_TIME_BUDGET', '0'))
+GOOGLE_PLAY_BASE_URL = os.getenv('GOOGLE_PLAY_BASE_URL', '')
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, 'output', 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '15'))
+METRICS_TEXTFILE_TTL = float(os.getenv('METRICS_TEXTFILE_TTL', '86400'))
+ASYNC_CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', '100'))
 
 # LOGIN
 
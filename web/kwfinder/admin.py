@@ -83,7 +83,13 @@ class KeywordAdmin(admin.ModelAdmin):
 
 @admin.register(models.AppPositionScriptRun)
 class AppPositionScriptRunAdmin(admin.ModelAdmin):
-    list_display = ("id", "started_at", "ended_at")
+    list_display = ("id", "started_at", "ended_at", "progress")
+
+    @admin.display(description="Прогресс")
+    def progress(self, obj: models.AppPositionScriptRun) -> str:
+        progress = obj.progress
+        return (f"{progress[models.AppPositionScriptRunTask.DONE]} / {sum(progress.values())}"
+                f" ({progress[models.AppPositionScriptRunTask.FAILED]} ошибок)")
 
 
 class AppInline(admin.TabularInline):
@@ -111,15 +117,37 @@ class AppGroupAdmin(admin.ModelAdmin):
 
 @admin.register(models.AppPositionScriptRunData)
 class AppPositionScriptRunDataAdmin(admin.ModelAdmin):
-    list_display = ("id", "run", "keyword", "app", "position")
+    list_display = ("id", "run", "keyword", "app", "position", "is_skipped")
     list_select_related = ("run", "app", "keyword")
     search_fields = ("keyword__name",)
     list_filter = (
         "app",
         "keyword",
+        "is_skipped",
     )
 
 
+@admin.register(models.StorePackage)
+class StorePackageAdmin(admin.ModelAdmin):
+    list_display = ("id", "package_id")
+    search_fields = ("package_id",)
+
+
+@admin.register(models.SerpSnapshot)
+class SerpSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("id", "run", "keyword", "size")
+    list_select_related = ("run", "keyword")
+    search_fields = ("keyword__name",)
+    exclude = ("package_ids",)
+
+    @admin.display(description="Позиций")
+    def size(self, obj: models.SerpSnapshot) -> int:
+        return len(obj.package_ids) // 4
+
+    def has_change_permission(self, request: HttpRequest, obj=None) -> bool:
+        return False
+
+
 @admin.register(models.DailyAggregatedPositionData)
 class DailyAggregatedPositionDataAdmin(admin.ModelAdmin):
     list_display = ("id", "date", "keyword", "app", "position")
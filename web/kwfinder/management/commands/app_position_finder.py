@@ -1,7 +1,10 @@
 import logging
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError, CommandParser
 
-from src.keywords import getKeywordsStats
+from src.keywords import getKeywordsStats, getKeywordsStatsWorker
+from src.keywords_async import getKeywordsStatsAsync
+from src.run_state import start_run
+from web.kwfinder.services import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -10,5 +13,54 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Uploads and saves stats for apps by keywords'
 
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--asyncio", action="store_true", dest="use_asyncio",
+            help="Use asyncio engine instead of threads. Number of requests in flight is set by ASYNC_CONCURRENCY")
+        parser.add_argument(
+            "--resume", nargs="?", type=int, const=0, default=None, metavar="RUN_ID",
+            help="Continue unfinished run with RUN_ID (the last unfinished run by default) "
+                 "skipping keywords that are already done")
+        parser.add_argument(
+            "--adaptive", action="store_true",
+            help="Skip keywords, whose positions are stable, if they were scraped in the last STABLE_SCRAPE_INTERVAL hours. "
+                 "Their last known positions are saved to the run")
+        parser.add_argument(
+            "--time-budget", type=float, default=None, metavar="SECONDS", dest="time_budget",
+            help="Stop taking new keywords after SECONDS (RUN_TIME_BUDGET by default, 0 - unlimited). "
+                 "Keywords with active orders and keitaro revenue are processed first")
+        parser.add_argument(
+            "--enqueue", action="store_true",
+            help="Only create new run with a task for every keyword. Tasks are processed by --worker processes")
+        parser.add_argument(
+            "--worker", nargs="?", type=int, const=0, default=None, metavar="RUN_ID",
+            help="Process tasks of the run with RUN_ID (the last unfinished run by default) "
+                 "together with other workers, that can run on other hosts")
+
     def handle(self, *args, **options):
-        getKeywordsStats()
+        with metrics.job_metrics("keywords_stats"):
+            self.__handle(options)
+
+    def __handle(self, options: dict):
+        if options['enqueue']:
+            started = start_run(adaptive=options['adaptive'])
+            if started:
+                self.stdout.write(str(started[0].id))
+            return
+
+        if options['worker'] is not None:
+            if options['use_asyncio']:
+                raise CommandError("--worker can't be used with --asyncio")
+            getKeywordsStatsWorker(run_id=options['worker'] or None, time_budget=options['time_budget'])
+            return
+
+        resume = options['resume'] is not None
+        run_id = options['resume'] or None
+
+        if options['use_asyncio']:
+            getKeywordsStatsAsync(
+                resume=resume, run_id=run_id, adaptive=options['adaptive'], time_budget=options['time_budget'])
+            return
+
+        getKeywordsStats(
+            resume=resume, run_id=run_id, adaptive=options['adaptive'], time_budget=options['time_budget'])
@@ -0,0 +1,61 @@
+import logging
+from pathlib import Path
+from time import perf_counter, process_time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from web.kwfinder.services.link_extractors import (LINK_EXTRACTORS,
+                                                   BeautifulSoupLinkExtractor,
+                                                   LxmlLinkExtractor, lxml)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks link extractors on saved store search pages (*.html) \
+        and checks that they return the same links as bs4'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("pages_dir", type=str, nargs="?", default="resources/serp_pages")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--url", type=str, default="https://play.google.com/store/search")
+
+    def handle(self, *args, **options):
+        paths = sorted(Path(options['pages_dir']).glob("*.html"))
+        if not paths:
+            raise CommandError(f"No *.html pages found in {options['pages_dir']}!")
+
+        pages = [path.read_text(encoding="utf-8") for path in paths]
+        url = options['url']
+        repeat = options['repeat']
+        reference = [BeautifulSoupLinkExtractor().extract(html=page, url=url) for page in pages]
+        self.stdout.write(
+            f"{len(pages)} pages, {sum(len(page) for page in pages) / len(pages) / 1024:.0f} KiB average, "
+            f"{sum(len(links) for links in reference)} links, {repeat} repeats")
+
+        base_time = None
+        for name, extractor_class in LINK_EXTRACTORS.items():
+            if extractor_class is LxmlLinkExtractor and not lxml:
+                self.stdout.write(f"{name:>8}: skipped, lxml is not installed")
+                continue
+
+            extractor = extractor_class()
+            results = [extractor.extract(html=page, url=url) for page in pages]
+            mismatches = [path.name for path, links, expected in zip(paths, results, reference)
+                          if links != expected]
+
+            wall_started_at = perf_counter()
+            cpu_started_at = process_time()
+            for _ in range(repeat):
+                for page in pages:
+                    extractor.extract(html=page, url=url)
+            cpu_time = process_time() - cpu_started_at
+            per_page = (perf_counter() - wall_started_at) / (repeat * len(pages))
+
+            if base_time is None:
+                base_time = per_page
+
+            self.stdout.write(
+                f"{name:>8}: {per_page * 1000:8.2f} ms/page, {cpu_time / (repeat * len(pages)) * 1000:8.2f} ms cpu/page, "
+                f"x{base_time / per_page:6.1f}, "
+                + ("same links" if not mismatches else f"DIFFERENT links in {', '.join(mismatches)}"))
@@ -0,0 +1,165 @@
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+from statistics import quantiles
+from time import monotonic, perf_counter, sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from src.keywords import getKeywordsStats
+from src.keywords_async import getKeywordsStatsAsync
+from src.serp_standin import SerpFixtureStore, serve_standin
+from web.kwfinder import models
+from web.kwfinder.services.metrics import SerpTraffic
+from web.kwfinder.services.proxy.proxy_pool import (ProxyEndpoint, ProxyPool,
+                                                    load_proxy_endpoints,
+                                                    use_proxy_pool)
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyRecordingProxyPool(ProxyPool):
+    """ Proxy pool, that keeps latencies of all successful requests """
+
+    def __init__(self, endpoints: list[ProxyEndpoint]) -> None:
+        super().__init__(endpoints=endpoints)
+        self.latencies = []
+
+    def record(self, endpoint: ProxyEndpoint, success: bool, latency: float | None = None):
+        if success and latency is not None:
+            self.latencies.append(latency)
+        super().record(endpoint, success=success, latency=latency)
+
+
+class Command(BaseCommand):
+    help = 'Runs the whole scraper (plan, download, parsing, database writes) against the local stand-in \
+        of the store, that replays recorded search pages (see record_serp_fixtures), or against the real store \
+        (--live), and reports keywords/sec, request latency percentiles and CPU time per page'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("pages_dir", type=str, nargs="?", default="resources/serp_pages")
+        parser.add_argument("--asyncio", action="store_true", dest="use_asyncio", help="Benchmark asyncio engine")
+        parser.add_argument("--latency", type=float, default=0.2, help="Mean response time of the stand-in, seconds")
+        parser.add_argument("--error-rate", type=float, default=0.0, dest="error_rate",
+                            help="Share of the requests, whose connection is dropped")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, dest="throttle_rate",
+                            help="Share of the requests, that get 429 status code")
+        parser.add_argument("--rate", type=float, default=None,
+                            help="Fixed rate limit of the stand-in proxy, requests/s (RATE_LIMIT_* settings by default)")
+        parser.add_argument("--transport", choices=["http1", "http2"], default=None,
+                            help="Store transport of the thread engine (STORE_TRANSPORT by default). "
+                                 "The stand-in speaks HTTP/1.1 only, so HTTP/2 is negotiated only with --live")
+        parser.add_argument("--parse-processes", type=int, default=None, dest="parse_processes",
+                            help="Parser processes of the thread engine (PARSE_PROCESSES by default)")
+        parser.add_argument("--live", action="store_true",
+                            help="Run against the real store through the proxies of the pool instead of the stand-in")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark run in database")
+
+    def handle(self, *args, **options):
+        if options['transport']:
+            settings.STORE_TRANSPORT = options['transport']
+        if options['parse_processes'] is not None:
+            settings.PARSE_PROCESSES = options['parse_processes']
+        if options['rate']:
+            settings.RATE_LIMIT_INITIAL = settings.RATE_LIMIT_MAX = options['rate']
+
+        if options['live']:
+            self.__benchmark(proxy_pool=LatencyRecordingProxyPool(endpoints=load_proxy_endpoints()), options=options)
+            return
+
+        if not len(SerpFixtureStore(options['pages_dir'])):
+            raise CommandError(f"No recorded pages found in {options['pages_dir']}! Record them with record_serp_fixtures.")
+
+        port = self.__getFreePort()
+        standin = multiprocessing.Process(
+            target=serve_standin, daemon=True,
+            kwargs=dict(fixtures_dir=options['pages_dir'], port=port, latency=options['latency'],
+                        error_rate=options['error_rate'], throttle_rate=options['throttle_rate']))
+        standin.start()
+        try:
+            self.__waitListening(port)
+
+            # The stand-in is both the store and the only proxy of the pool
+            url = f"http://127.0.0.1:{port}"
+            settings.GOOGLE_PLAY_BASE_URL = f"{url}/store/search?c=apps"
+            os.environ['PROXY_TEST_URL'] = f"{url}/"
+            self.__benchmark(
+                proxy_pool=LatencyRecordingProxyPool(endpoints=[ProxyEndpoint(proxies={'http': url, 'https': url})]),
+                options=options)
+        finally:
+            standin.terminate()
+            standin.join()
+
+    @staticmethod
+    def __cpuTime() -> tuple[float, float]:
+        """ Returns user + system CPU time of this process and of its finished child processes.
+        Parse pool workers are joined when the scraper ends, so their time is in the second value. """
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+    def __benchmark(self, proxy_pool: LatencyRecordingProxyPool, options: dict):
+        if not len(proxy_pool):
+            raise CommandError("Proxy pool is empty!")
+        use_proxy_pool(proxy_pool)
+
+        last_run = models.AppPositionScriptRun.objects.order_by("-id").first()
+        traffic = SerpTraffic()
+        cpu_before = self.__cpuTime()
+        started_at = perf_counter()
+        if options['use_asyncio']:
+            getKeywordsStatsAsync()
+        else:
+            getKeywordsStats()
+        wall_time = perf_counter() - started_at
+        cpu_after = self.__cpuTime()
+        cpu_time = sum(cpu_after) - sum(cpu_before)
+        children_cpu_time = cpu_after[1] - cpu_before[1]
+
+        runs = models.AppPositionScriptRun.objects.filter(id__gt=last_run.id if last_run else 0)
+        tasks = models.AppPositionScriptRunTask.objects.filter(run__in=runs)
+        keywords = tasks.filter(state=models.AppPositionScriptRunTask.DONE).count()
+        failed = tasks.filter(state=models.AppPositionScriptRunTask.FAILED).count()
+        latencies = proxy_pool.latencies
+        pages = len(latencies)
+
+        engine = "asyncio" if options['use_asyncio'] else (
+            f"threads ({settings.STORE_TRANSPORT}, {settings.PARSE_PROCESSES or 'no'} parser processes)")
+        self.stdout.write(
+            f"{engine}: {keywords} keywords done, {failed} failed, "
+            f"{pages} pages downloaded in {wall_time:.1f}s")
+        self.stdout.write(f"  {keywords / wall_time:8.2f} keywords/s")
+        if pages > 1:
+            percentiles = quantiles(latencies, n=100)
+            self.stdout.write(
+                f"  {percentiles[49] * 1000:8.1f} ms p50 latency, {percentiles[94] * 1000:8.1f} ms p95 latency")
+        if pages:
+            self.stdout.write(
+                f"  {cpu_time / pages * 1000:8.2f} ms cpu/page ({cpu_time:.1f}s cpu total, "
+                f"{children_cpu_time:.1f}s in parser processes)")
+        self.stdout.write(f"  {traffic.summary(keywords=keywords)}")
+
+        if options['keep']:
+            self.stdout.write(f"Benchmark runs are kept: {', '.join(str(run.id) for run in runs)}")
+        else:
+            runs.delete()
+
+    @staticmethod
+    def __getFreePort() -> int:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    @staticmethod
+    def __waitListening(port: int, timeout: float = 10):
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return
+            except OSError:
+                sleep(0.1)
+        raise CommandError(f"Stand-in server didn't start on port {port}!")
@@ -5,8 +5,8 @@ from django.core.management.base import BaseCommand
 
 from src.apps_state import check_app
 from web.kwfinder import models
-from web.kwfinder.services.proxy.simple_proxy import (
-    create_proxy_requests_session, get_proxy, safe_proxy_repr)
+from web.kwfinder.services import metrics
+from web.kwfinder.services.proxy.proxy_pool import get_proxy_pool
 
 logger = logging.getLogger(__name__)
 
@@ -16,19 +16,33 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         logger.info("Checking apps state!")
+        with metrics.job_metrics("check_apps_state"):
+            self.__checkApps()
 
+    def __checkApps(self):
         apps = models.App.objects.filter(is_active=True)
-        proxies = get_proxy()
-        if not proxies:
+        proxy_pool = get_proxy_pool()
+        if not len(proxy_pool):
             logger.error("Can't find proxy. Aborting!")
             return
 
-        session = create_proxy_requests_session(proxy=proxies)
-        if not session:
-            logger.error(
-                f"Can't create session for proxy {safe_proxy_repr(proxies)}. Aborting!")
-            return
-
         for app in apps:
-            check_app(app, session)
+            proxy = proxy_pool.acquire(region_code=app.region_id)
+            success = None
+            try:
+                session = proxy.session.get()
+                if not session:
+                    success = False
+                    logger.error(
+                        f"Can't create session for proxy {proxy}. Skipping app {app.name}_{app.num}!")
+                    metrics.JOB_ITEMS.inc(job="check_apps_state", result="skipped")
+                    continue
+
+                success = check_app(app, session)
+            finally:
+                proxy_pool.release(proxy, success=success)
+
+            metrics.JOB_ITEMS.inc(job="check_apps_state", result="checked")
             sleep(2)
+
+        logger.info(proxy_pool.summary())
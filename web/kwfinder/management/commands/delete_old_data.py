@@ -21,4 +21,6 @@ class Command(BaseCommand):
             run__id__in=list(old_runs.values_list('id', flat=True)))
 
         deleted = old_data.delete()
-        logger.info(f"End of deleting data! Deleted {deleted}.")
+        # tasks keep checked apps of sparse runs (see `position_store`), so they are old data too
+        deleted_tasks = models.AppPositionScriptRunTask.objects.filter(run__in=old_runs).delete()
+        logger.info(f"End of deleting data! Deleted {deleted}, {deleted_tasks}.")
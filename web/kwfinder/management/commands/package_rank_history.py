@@ -0,0 +1,35 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from src.serp_snapshots import package_rank_history
+from web.kwfinder import models
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Prints positions of any store app (e.g. competitor) by keywords from the stored \
+        search page snapshots (SERP_SNAPSHOTS), without requests to the store'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("package_id", type=str)
+        parser.add_argument("--keyword", type=int, action="append", dest="keyword_ids",
+                            help="Keyword id, can be repeated. All keywords by default")
+        parser.add_argument("--days", type=int, default=7, help="Number of the last days")
+
+    def handle(self, *args, **options):
+        history = package_rank_history(
+            package_id=options['package_id'],
+            keyword_ids=options['keyword_ids'],
+            started_after=timezone.now() - timedelta(days=options['days']))
+        if not history:
+            self.stdout.write(f"{options['package_id']} is not found in the search page snapshots.")
+            return
+
+        keywords = models.Keyword.objects.select_related("region").in_bulk(list(history))
+        for keyword_id, positions in history.items():
+            self.stdout.write(f"{keywords[keyword_id]}: " + ", ".join(
+                f"{started_at.strftime(r'%d-%m %H:%M')} {position or '-'}" for started_at, position in positions))
@@ -0,0 +1,70 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from exceptions import SearchThrottled
+from src.rate_limiter import get_rate_limiter
+from src.run_plan import build_run_plan
+from src.serp_standin import SerpFixtureStore
+from web.kwfinder.services.googlePlayServicePlain import GooglePlayService
+from web.kwfinder.services.proxy.proxy_pool import get_proxy_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Records store search pages of the run plan keywords, so they can be replayed \
+        by the stand-in server (see benchmark_scraper) and used by benchmark_link_extractors'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("pages_dir", type=str, nargs="?", default="resources/serp_pages")
+        parser.add_argument("--limit", type=int, default=50, help="Number of keywords to record, 0 - all")
+
+    def handle(self, *args, **options):
+        store = SerpFixtureStore(options['pages_dir'])
+        plan = build_run_plan()
+        if options['limit']:
+            plan = plan[:options['limit']]
+
+        proxy_pool = get_proxy_pool()
+        if not len(proxy_pool):
+            raise CommandError("Proxy pool is empty!")
+
+        recorded = 0
+        for keyword in plan:
+            proxy = proxy_pool.acquire(region_code=keyword.region_code)
+            rate_limiter = get_rate_limiter(proxy.name)
+            success = None
+            try:
+                session = proxy.session.get()
+                if not session:
+                    success = False
+                    continue
+
+                rate_limiter.acquire()
+                url = GooglePlayService(base_url=keyword.base_url).buildSearchUrl(
+                    keyword=keyword.query, attributes=keyword.store_attributes)
+                r = session.get(url, timeout=settings.TIMEOUT_TIME)
+                GooglePlayService.checkThrottled(status_code=r.status_code, url=str(r.url), html=r.text)
+                success = r.status_code == 200
+                if not success or not GooglePlayService.parseAppLinks(html=r.text, url=url):
+                    logger.warning(f"Search page of keyword {keyword} is not recorded: {r.status_code} status code or no links")
+                    continue
+
+                rate_limiter.success()
+                store.save(url=str(r.request.url), html=r.text)
+                recorded += 1
+
+            except SearchThrottled as e:
+                rate_limiter.throttled(reason=str(e))
+                logger.warning(f"Search page of keyword {keyword} is not recorded: {e}")
+
+            except Exception as e:
+                success = False
+                logger.exception(e)
+
+            finally:
+                proxy_pool.release(proxy, success=success)
+
+        self.stdout.write(f"{recorded} of {len(plan)} search pages recorded to {store.path}, {len(store)} pages total")
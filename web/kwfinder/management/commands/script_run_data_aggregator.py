@@ -1,4 +1,6 @@
-from django.core.management.base import BaseCommand, CommandParser
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
 import logging
 
 from src.keywords import mergeKeywordStatsForDays
@@ -9,13 +11,23 @@ logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'Aggregates stats for a given day for uploaded apps for keywords'
+    help = 'Aggregates stats for a given day (or days up to --until) for uploaded apps for keywords. \
+        Aggregating a day again updates only changed positions.'
 
     def add_arguments(self, parser: CommandParser) -> None:
         parser.add_argument("day", type=str)
+        parser.add_argument("--until", type=str, default=None, help="Last day of the range (inclusive)")
 
     def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['day'], r"%Y-%m-%d").date()
+            until = datetime.strptime(options['until'], r"%Y-%m-%d").date() if options['until'] else day
+        except ValueError as e:
+            raise CommandError(f"Days must be in YYYY-MM-DD format: {e}")
+
         logger.info(
-            f"Starting aggregate stats for {options['day']} for uploaded stats for keywords.")
+            f"Starting aggregate stats for {day} - {until} for uploaded stats for keywords.")
 
-        mergeKeywordStatsForDays(day=options['day'])
+        while day <= until:
+            mergeKeywordStatsForDays(day=day.strftime(r"%Y-%m-%d"))
+            day += timedelta(days=1)
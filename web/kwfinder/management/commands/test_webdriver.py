@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from src.driver_module import testDriver
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Checks that webdrivers start and load pages. Pages are opened with the drivers \
+        of the pool (DRIVER_POOL_SIZE), that are quit at the end'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--pages", type=int, default=1)
+        parser.add_argument("--url", type=str, default="https://google.com")
+
+    def handle(self, *args, **options):
+        testDriver(pages=options['pages'], url=options['url'])
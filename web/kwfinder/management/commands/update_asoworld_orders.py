@@ -2,6 +2,7 @@ import logging
 from django.core.management.base import BaseCommand
 
 from src.asoworld import update_orders
+from web.kwfinder.services import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -12,4 +13,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         logger.info("Starting update ASO World orders data")
-        update_orders()
+        with metrics.job_metrics("update_orders"):
+            update_orders()
@@ -3,6 +3,7 @@ from datetime import date, timedelta
 import logging
 
 from src.keitaro import update_keitaro_stats
+from web.kwfinder.services import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -16,4 +17,5 @@ class Command(BaseCommand):
         date_from = date.today() - timedelta(days=5)
         date_to = date.today()
 
-        update_keitaro_stats(date_from, date_to)
+        with metrics.job_metrics("update_keitaro_stats"):
+            update_keitaro_stats(date_from, date_to)
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0021_appgroup_app_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppPositionScriptRunTask',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='id')),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'В очереди'), (1, 'Обработано'), (2, 'Ошибка')], default=0, verbose_name='Статус')),
+                ('finished_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Завершено')),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kwfinder.keyword', verbose_name='Ключевое слово')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kwfinder.apppositionscriptrun', verbose_name='Запуск скрипта')),
+            ],
+            options={
+                'verbose_name': 'Задача запуска скрипта',
+                'verbose_name_plural': 'Задачи запуска скрипта',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='apppositionscriptruntask',
+            index=models.Index(fields=['run', 'state'], name='run_task_state_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='apppositionscriptruntask',
+            constraint=models.UniqueConstraint(fields=('run', 'keyword'), name='unique_run_keyword_task'),
+        ),
+    ]
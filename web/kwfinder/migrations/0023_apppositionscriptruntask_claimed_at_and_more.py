@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0022_apppositionscriptruntask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apppositionscriptruntask',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='Взято в работу'),
+        ),
+        migrations.AddField(
+            model_name='apppositionscriptruntask',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Обработчик'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0023_apppositionscriptruntask_claimed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apppositionscriptrundata',
+            name='is_skipped',
+            field=models.BooleanField(blank=True, default=False, verbose_name='Не проверялась (взята из истории)'),
+        ),
+    ]
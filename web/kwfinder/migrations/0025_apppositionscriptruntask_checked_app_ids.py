@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0024_apppositionscriptrundata_is_skipped'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apppositionscriptruntask',
+            name='checked_app_ids',
+            field=models.JSONField(blank=True, default=None, null=True, verbose_name='Проверенные приложения'),
+        ),
+    ]
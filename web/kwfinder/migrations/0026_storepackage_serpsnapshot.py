@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0025_apppositionscriptruntask_checked_app_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorePackage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='id')),
+                ('package_id', models.CharField(max_length=255, unique=True, verbose_name='ID пакета')),
+            ],
+            options={
+                'verbose_name': 'Пакет из выдачи стора',
+                'verbose_name_plural': 'Пакеты из выдачи стора',
+            },
+        ),
+        migrations.CreateModel(
+            name='SerpSnapshot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='id')),
+                ('package_ids', models.BinaryField(verbose_name='ID пакетов по позициям')),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kwfinder.keyword', verbose_name='Ключевое слово')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kwfinder.apppositionscriptrun', verbose_name='Запуск скрипта')),
+            ],
+            options={
+                'verbose_name': 'Снимок выдачи стора',
+                'verbose_name_plural': 'Снимки выдачи стора',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='serpsnapshot',
+            constraint=models.UniqueConstraint(fields=('run', 'keyword'), name='unique_run_keyword_snapshot'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:22
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def remove_duplicates(apps, schema_editor):
+    """ Keeps only the last aggregated row of every (app, keyword, date) """
+    DailyAggregatedPositionData = apps.get_model("kwfinder", "DailyAggregatedPositionData")
+    last_ids = DailyAggregatedPositionData.objects.order_by().values(
+        "app", "keyword", "date").annotate(last_id=Max("id")).values("last_id")
+    DailyAggregatedPositionData.objects.exclude(id__in=last_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0026_storepackage_serpsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, reverse_code=migrations.RunPython.noop),
+    ]
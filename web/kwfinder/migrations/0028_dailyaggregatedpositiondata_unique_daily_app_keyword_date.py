@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kwfinder', '0027_remove_dailyaggregatedpositiondata_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='dailyaggregatedpositiondata',
+            constraint=models.UniqueConstraint(fields=('app', 'keyword', 'date'), name='unique_daily_app_keyword_date'),
+        ),
+    ]
@@ -116,10 +116,66 @@ class AppPositionScriptRun(models.Model):
         verbose_name = "Запуск скрипта (поиск позиций приложений)"
         verbose_name_plural = "Запуски скрипта"
 
+    @property
+    def progress(self) -> dict[int, int]:
+        """ Number of run's keyword tasks by their state """
+        counts = dict.fromkeys(
+            (state for state, _ in AppPositionScriptRunTask.STATE_CHOICES), 0)
+        counts.update(self.apppositionscriptruntask_set.values_list(  # type: ignore
+            "state").annotate(count=models.Count("id")).values_list("state", "count"))
+        return counts
+
     def __str__(self):
         return f"[{self.id}] {self.started_at.strftime(r'%d-%m-%Y %H:%M:%S')}"
 
 
+class AppPositionScriptRunTask(models.Model):
+    """ Модель, описывающая ключевое слово, которое нужно обработать
+    в конкретном запуске скрипта по поиску позиций """
+    PENDING = 0
+    DONE = 1
+    FAILED = 2
+    STATE_CHOICES = (
+        (PENDING, "В очереди"),
+        (DONE, "Обработано"),
+        (FAILED, "Ошибка"),
+    )
+
+    id = models.AutoField("id", primary_key=True)
+    run = models.ForeignKey(AppPositionScriptRun,
+                            verbose_name="Запуск скрипта",
+                            on_delete=models.CASCADE)
+    keyword = models.ForeignKey(
+        Keyword, verbose_name="Ключевое слово", on_delete=models.CASCADE)
+    state = models.PositiveSmallIntegerField(
+        "Статус", choices=STATE_CHOICES, default=PENDING)
+    finished_at = models.DateTimeField(
+        "Завершено", null=True, default=None, blank=True)
+    claimed_by = models.CharField(
+        "Обработчик", max_length=255, default="", blank=True)
+    claimed_at = models.DateTimeField(
+        "Взято в работу", null=True, default=None, blank=True)
+    # Разреженное хранение: сохраняются только ненулевые позиции,
+    # отсутствующая строка проверенного приложения означает позицию 0
+    checked_app_ids = models.JSONField(
+        "Проверенные приложения", null=True, default=None, blank=True)
+
+    class Meta:
+        verbose_name = "Задача запуска скрипта"
+        verbose_name_plural = "Задачи запуска скрипта"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "keyword"], name="unique_run_keyword_task"),
+        ]
+        indexes = [
+            models.Index(fields=["run", "state"],
+                         name="run_task_state_idx"),
+        ]
+
+    def __str__(self):
+        return f"[{self.run_id}] {self.keyword_id} - {self.get_state_display()}"
+
+
 class AppPositionScriptRunData(models.Model):
     """ Модель, описывающая полученные данные в конкретный запуск скрипта
     по поиску позиций приложения по ключевым словам """
@@ -132,6 +188,8 @@ class AppPositionScriptRunData(models.Model):
     app = models.ForeignKey(
         App, verbose_name="Приложение", on_delete=models.CASCADE)
     position = models.IntegerField("Позиция", default=0)
+    is_skipped = models.BooleanField(
+        "Не проверялась (взята из истории)", default=False, blank=True)
 
     class Meta:
         verbose_name = "Данные запуска скрипта"
@@ -141,6 +199,44 @@ class AppPositionScriptRunData(models.Model):
         return f"{self.keyword.name} - {self.app.name} - {self.position}"
 
 
+class StorePackage(models.Model):
+    """ Модель, описывающая пакет приложения из выдачи стора
+    (словарь для снимков выдачи) """
+    id = models.AutoField("id", primary_key=True)
+    package_id = models.CharField("ID пакета", max_length=255, unique=True)
+
+    class Meta:
+        verbose_name = "Пакет из выдачи стора"
+        verbose_name_plural = "Пакеты из выдачи стора"
+
+    def __str__(self):
+        return self.package_id
+
+
+class SerpSnapshot(models.Model):
+    """ Модель, описывающая выдачу стора по ключевому слову в конкретный запуск скрипта.
+    Выдача хранится как массив id пакетов (uint32, little-endian) в порядке позиций,
+    0 - ссылка не на приложение """
+    id = models.AutoField("id", primary_key=True)
+    run = models.ForeignKey(AppPositionScriptRun,
+                            verbose_name="Запуск скрипта",
+                            on_delete=models.CASCADE)
+    keyword = models.ForeignKey(
+        Keyword, verbose_name="Ключевое слово", on_delete=models.CASCADE)
+    package_ids = models.BinaryField("ID пакетов по позициям")
+
+    class Meta:
+        verbose_name = "Снимок выдачи стора"
+        verbose_name_plural = "Снимки выдачи стора"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "keyword"], name="unique_run_keyword_snapshot"),
+        ]
+
+    def __str__(self):
+        return f"[{self.run_id}] {self.keyword_id}"
+
+
 class DailyAggregatedPositionData(models.Model):
     """ Модель, описывающая агрегированные данные 
     по позициям приложений по дням """
@@ -155,6 +251,10 @@ class DailyAggregatedPositionData(models.Model):
     class Meta:
         verbose_name = "Агрегированные данные по дням"
         verbose_name_plural = "Агрегированные данные по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["app", "keyword", "date"], name="unique_daily_app_keyword_date"),
+        ]
 
     def __str__(self):
         return f"{self.keyword.name} - {self.app.name} - {self.position}"
@@ -1,33 +1,186 @@
+import codecs
 import logging
-from typing import List
-from urllib.parse import urljoin
+from time import perf_counter
+from typing import TYPE_CHECKING, Iterator, List
 
-# from django.conf import settings
 import requests
-from bs4 import BeautifulSoup
+from django.conf import settings
+
+from exceptions import SearchThrottled
+
+from . import metrics
+from .link_extractors import StreamingLinkScanner, get_link_extractor
+
+if TYPE_CHECKING:
+    from .parse_pool import ParsePool
 
 logger = logging.getLogger(__name__)
 
 
 class GooglePlayService:
     """ Class to manage google store service """
+    THROTTLED_STATUS_CODES = (429, 403)
+    CAPTCHA_MARKERS = ("g-recaptcha", "/sorry/index", "unusual traffic from your computer")
 
-    def __init__(self, base_url: str, thread_num: int = 0, session: requests.Session | None = None) -> None:
+    def __init__(self,
+                 base_url: str,
+                 thread_num: int = 0,
+                 session: requests.Session | None = None,
+                 parse_pool: "ParsePool | None" = None) -> None:
         self.base_url = base_url
         self.thread_num = thread_num
         self.session = session if session else requests.Session()
+        self.parse_pool = parse_pool
 
-    def getAllAppLinks(self, keyword: str, attributes: str) -> List[str]:
-        """ Retruns list of all apps' links from store page with given attributes. """
-        l = []
-        url = f"{self.base_url}&q={keyword}&{attributes}"
+    def getAllAppLinks(self, keyword: str, attributes: str, stop_package_ids: set[str] | None = None) -> List[str]:
+        """ Retruns list of all apps' links from store page with given attributes.
+        If `settings.SERP_STREAMING` is on, the page is parsed while it is downloaded (see `streamAppLinks`).
+        Otherwise, if service has `parse_pool`, the page is parsed in its worker process. """
+        url = self.buildSearchUrl(keyword=keyword, attributes=attributes)
+        if settings.SERP_STREAMING:
+            return self.streamAppLinks(url=url, stop_package_ids=stop_package_ids)
 
         r = self.session.get(url)
+        if self.parse_pool:
+            self.checkThrottled(status_code=r.status_code, url=str(r.url), html="")
+            self.recordTraffic(mode="full", downloaded=self.__downloadedBytes(r, default=len(r.content)))
+            # captcha markers are checked by the worker, so the page is decoded only there
+            return self.parse_pool.parse(
+                content=r.content, encoding=r.encoding, status_code=r.status_code, response_url=str(r.url), url=url)
+
+        self.checkThrottled(status_code=r.status_code, url=str(r.url), html=r.text)
+        self.recordTraffic(mode="full", downloaded=self.__downloadedBytes(r, default=len(r.content)))
+
+        return self.parseAppLinks(html=r.text, url=url)
+
+    def streamAppLinks(self, url: str, stop_package_ids: set[str] | None = None) -> List[str]:
+        """ Downloads store search page in `settings.SERP_STREAM_CHUNK_SIZE` chunks and parses them
+        as they come (see `SerpStreamParser`). Stopped HTTP/1.1 connection is closed,
+        HTTP/2 stream is reset keeping the connection.
+
+        Args:
+            url (str): search page url
+            stop_package_ids (set[str] | None, optional): package ids, whose positions are needed.
+                Defaults to None (read the whole page).
+
+        Returns:
+            List[str]: links in the order they are shown in store, up to the last needed one
+        """
+        r = self.session.get(url, stream=True)
+        try:
+            parser = SerpStreamParser(
+                url=url, status_code=r.status_code, response_url=str(r.url),
+                encoding=r.encoding, stop_package_ids=stop_package_ids)
+            for chunk in self.__iterChunks(r):
+                if parser.feed(chunk):
+                    break
+            return parser.close()
+
+        finally:
+            self.recordTraffic(
+                mode="streamed",
+                downloaded=self.__downloadedBytes(r, default=0),
+                content_length=int(r.headers.get("Content-Length") or 0))
+            r.close()
+
+    def buildSearchUrl(self, keyword: str, attributes: str) -> str:
+        """ Returns store search page url for given `keyword` and store `attributes`. """
+        return f"{self.base_url}&q={keyword}&{attributes}"
+
+    @classmethod
+    def checkThrottled(cls, status_code: int, url: str, html: str):
+        """ Raises `SearchThrottled` if store responded with throttling status code or captcha page """
+        if status_code in cls.THROTTLED_STATUS_CODES:
+            raise SearchThrottled(f"Store responded with {status_code} status code!")
+
+        if any(marker in url or marker in html for marker in cls.CAPTCHA_MARKERS):
+            raise SearchThrottled(f"Store responded with captcha page {url}!")
+
+    @staticmethod
+    def recordTraffic(mode: str, downloaded: int, content_length: int = 0):
+        """ Adds downloaded search page to the traffic metrics
+
+        Args:
+            mode (str): "full" or "streamed"
+            downloaded (int): bytes read from the network
+            content_length (int, optional): page size by Content-Length header. Defaults to 0 (unknown).
+        """
+        metrics.SERP_PAGES.inc(mode=mode)
+        metrics.SERP_BYTES.inc(downloaded, mode=mode)
+        if content_length > downloaded:
+            metrics.SERP_BYTES_SKIPPED.inc(content_length - downloaded)
+
+    @staticmethod
+    def __iterChunks(r) -> Iterator[bytes]:
+        if hasattr(r, "iter_content"):  # requests
+            return r.iter_content(chunk_size=settings.SERP_STREAM_CHUNK_SIZE)
+        return r.iter_bytes(chunk_size=settings.SERP_STREAM_CHUNK_SIZE)  # httpx
+
+    @staticmethod
+    def __downloadedBytes(r, default: int) -> int:
+        """ Returns number of bytes of the response read from the network (compressed) """
+        if hasattr(r, "num_bytes_downloaded"):  # httpx
+            return r.num_bytes_downloaded
+        try:
+            return r.raw.tell()  # requests
+        except Exception:
+            return default
+
+    @staticmethod
+    def parseAppLinks(html: str, url: str) -> List[str]:
+        """ Returns list of all apps' links from store search page `html`.
+
+        Args:
+            html (str): search page content
+            url (str): search page url, used to resolve relative links
+
+        Returns:
+            List[str]: links in the order they are shown in store
+        """
+        with metrics.PARSE_DURATION.time():
+            return get_link_extractor(settings.LINK_EXTRACTOR).extract(html=html, url=url)
+
+
+class SerpStreamParser:
+    """ Parses store search page from the raw chunks of the response body. Checks chunks for captcha
+    and tells when the rest of the page is not needed: all `stop_package_ids` are found
+    or `settings.SERP_RESULTS_END_MARKER` is reached. """
+
+    def __init__(self,
+                 url: str,
+                 status_code: int,
+                 response_url: str,
+                 encoding: str | None = None,
+                 stop_package_ids: set[str] | None = None) -> None:
+        GooglePlayService.checkThrottled(status_code=status_code, url=response_url, html="")
+        self.status_code = status_code
+        self.response_url = response_url
+        self.parse_time = 0.0
+
+        self._scanner = StreamingLinkScanner(
+            url=url, stop_package_ids=stop_package_ids, end_marker=settings.SERP_RESULTS_END_MARKER)
+        self._decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        self._tail = ""
+
+    def feed(self, chunk: bytes) -> bool:
+        """ Parses next chunk of the body
+
+        Returns:
+            bool: True if the rest of the body is not needed
+        """
+        text = self._decoder.decode(chunk)
+        # tail of the previous chunk catches captcha markers split between chunks
+        GooglePlayService.checkThrottled(status_code=self.status_code, url=self.response_url, html=self._tail + text)
+        self._tail = text[-100:]
 
-        parsed_html = BeautifulSoup(r.text, features="html.parser")
-        main = parsed_html.find('a', class_='Qfxief')
-        if main:
-            l.append(urljoin(url, main['href']))
+        started = perf_counter()
+        complete = self._scanner.feed(text)
+        self.parse_time += perf_counter() - started
+        return complete
 
-        apps = parsed_html.find_all('a', class_='Gy4nib')
-        return l + [urljoin(url, x['href']) for x in apps]
+    def close(self) -> List[str]:
+        """ Finishes parsing and returns links in the order they are shown in store """
+        if not self._scanner.is_complete:
+            self._scanner.feed(self._decoder.decode(b"", final=True))
+        metrics.PARSE_DURATION.observe(self.parse_time)
+        return self._scanner.links
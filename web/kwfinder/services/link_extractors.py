@@ -0,0 +1,286 @@
+import logging
+import re
+from functools import lru_cache
+from html import unescape
+from typing import List
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+MAIN_APP_CLASS = 'Qfxief'
+APP_CLASS = 'Gy4nib'
+APP_DETAILS_PATH = '/store/apps/details'
+
+
+def package_id_from_link(link: str) -> str | None:
+    """ Returns package id of the app from its store page link. Other query params
+    (`hl`, `gl`, `pli`, ...) and fragments are ignored.
+
+    Args:
+        link (str): absolute or relative app details link
+
+    Returns:
+        str | None: package id. None if `link` is not an app details link.
+    """
+    parts = urlsplit(link)
+    if not parts.path.rstrip('/').endswith(APP_DETAILS_PATH):
+        return None
+
+    ids = parse_qs(parts.query).get('id')
+    return ids[0] if ids else None
+
+
+def positions_by_package_id(links: List[str]) -> dict[str, int]:
+    """ Returns map of package id to its position (starts with 1) in `links`.
+    If app is shown several times, its first position is used. Keys are ordered by position.
+
+    Args:
+        links (List[str]): links from store search page
+
+    Returns:
+        dict[str, int]: positions
+    """
+    positions = {}
+    for position, link in enumerate(links, start=1):
+        package_id = package_id_from_link(link)
+        if package_id and package_id not in positions:
+            positions[package_id] = position
+    return positions
+
+
+class LinkExtractor:
+    """ Base class of store search page parsers. Extractor returns main app link
+    (`a.Qfxief`) first and then all app links (`a.Gy4nib`) in the page order. """
+    name = ""
+
+    def extract(self, html: str, url: str) -> List[str]:
+        """ Returns list of all apps' links from store search page `html`.
+
+        Args:
+            html (str): search page content
+            url (str): search page url, used to resolve relative links
+
+        Returns:
+            List[str]: links in the order they are shown in store
+        """
+        raise NotImplementedError
+
+
+class BeautifulSoupLinkExtractor(LinkExtractor):
+    """ Builds full BeautifulSoup tree with `html.parser`. Slow, but it is the reference. """
+    name = "bs4"
+
+    def extract(self, html: str, url: str) -> List[str]:
+        l = []
+        parsed_html = BeautifulSoup(html, features="html.parser")
+        main = parsed_html.find('a', class_=MAIN_APP_CLASS)
+        if main:
+            l.append(urljoin(url, main['href']))
+
+        apps = parsed_html.find_all('a', class_=APP_CLASS)
+        return l + [urljoin(url, x['href']) for x in apps]
+
+
+class LxmlLinkExtractor(LinkExtractor):
+    """ Parses page with lxml (C parser) and selects anchors with xpath. Needs `lxml` package. """
+    name = "lxml"
+
+    MAIN_XPATH = f"//a[contains(concat(' ', normalize-space(@class), ' '), ' {MAIN_APP_CLASS} ')]"
+    APPS_XPATH = f"//a[contains(concat(' ', normalize-space(@class), ' '), ' {APP_CLASS} ')]"
+
+    def __init__(self) -> None:
+        if lxml is None:
+            raise ImproperlyConfigured("LINK_EXTRACTOR=lxml needs lxml package, it is not installed!")
+
+    def extract(self, html: str, url: str) -> List[str]:
+        if not html.strip():
+            return []
+
+        tree = lxml.html.fromstring(html)
+        l = []
+        main = tree.xpath(self.MAIN_XPATH)
+        if main:
+            l.append(urljoin(url, main[0].get('href')))
+
+        return l + [urljoin(url, x.get('href')) for x in tree.xpath(self.APPS_XPATH)]
+
+
+class AnchorScanLinkExtractor(LinkExtractor):
+    """ Scans page with regular expressions for `<a>` start tags only, skipping
+    scripts, styles and comments. Doesn't build any tree. Malformed markup (e.g. unclosed
+    comment or script) can hide the links from the scanner, so the page is parsed with
+    `BeautifulSoupLinkExtractor` if no links are found, but the page has app links class. """
+    name = "scanner"
+
+    TAG_RE = re.compile(
+        r"<!--.*?-->|<(script|style)\b.*?</\1\s*>|<a\s((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+        re.IGNORECASE | re.DOTALL)
+    ATTRIBUTE_RE = re.compile(
+        r"([^\s=/>\"']+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>\"']+)))?")
+
+    def extract(self, html: str, url: str) -> List[str]:
+        main = None
+        apps = []
+
+        for match in self.TAG_RE.finditer(html):
+            attributes_str = match.group(2)
+            if attributes_str is None:
+                continue
+
+            attributes = self.parseAttributes(attributes_str)
+            classes = attributes.get('class', '').split()
+            if MAIN_APP_CLASS in classes and main is None:
+                main = urljoin(url, attributes['href'])
+            if APP_CLASS in classes:
+                apps.append(urljoin(url, attributes['href']))
+
+        if not main and not apps and APP_CLASS in html:
+            logger.warning(f"Scanner found no app links on the page {url} with {APP_CLASS} class. Parsing it with bs4.")
+            return BeautifulSoupLinkExtractor().extract(html=html, url=url)
+
+        return ([main] if main else []) + apps
+
+    @classmethod
+    def parseAttributes(cls, attributes_str: str) -> dict[str, str]:
+        """ Returns dict of tag attributes with unescaped values """
+        attributes = {}
+        for name, double_quoted, single_quoted, unquoted in cls.ATTRIBUTE_RE.findall(attributes_str):
+            value = double_quoted or single_quoted or unquoted
+            attributes[name.lower()] = unescape(value)
+        return attributes
+
+
+class StreamingLinkScanner:
+    """ Incremental `AnchorScanLinkExtractor` for pages, that are read in chunks. Only the unfinished
+    tag at the end of the fed text is kept, so the page is never held in memory. `feed` tells
+    when the rest of the page is not needed anymore:
+    - all `stop_package_ids` are found (their positions are known);
+    - `end_marker` (markup after the search results) is found after the first app link. """
+
+    OPEN_RE = re.compile(r"<!--|<(script|style)\b|<a\s", re.IGNORECASE)
+    RAW_END_RES = {
+        "script": re.compile(r"</script\s*>", re.IGNORECASE),
+        "style": re.compile(r"</style\s*>", re.IGNORECASE),
+    }
+    ATTRIBUTES_RE = re.compile(r"((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>")
+    MAX_TAG_LENGTH = 64 * 1024
+
+    def __init__(self, url: str, stop_package_ids: set[str] | None = None, end_marker: str = "") -> None:
+        self.url = url
+        self.end_marker = end_marker
+        self.main = None
+        self.apps = []
+        self.is_complete = False
+
+        self._pending = set(stop_package_ids) if stop_package_ids else None
+        self._tail = ""
+        self._raw_tag = None  # "!--", "script" or "style" while inside of them
+
+    @property
+    def links(self) -> List[str]:
+        return ([self.main] if self.main else []) + self.apps
+
+    def feed(self, text: str) -> bool:
+        """ Scans next chunk of the page
+
+        Returns:
+            bool: True if the rest of the page is not needed
+        """
+        if self.is_complete:
+            return True
+
+        buffer = self._tail + text
+        position = self.__scan(buffer)
+        self._tail = buffer[position:]
+
+        if self.end_marker and (self.main or self.apps) and self.end_marker in buffer:
+            self.is_complete = True
+        return self.is_complete
+
+    def __scan(self, buffer: str) -> int:
+        """ Scans `buffer` and returns position, from which it must be scanned again with the next chunk """
+        position = 0
+        while not self.is_complete:
+            if self._raw_tag == "!--":
+                end = buffer.find("-->", position)
+                if end < 0:
+                    return max(position, len(buffer) - 2)
+                position, self._raw_tag = end + 3, None
+
+            elif self._raw_tag:
+                match = self.RAW_END_RES[self._raw_tag].search(buffer, position)
+                if not match:
+                    return max(position, len(buffer) - 16)
+                position, self._raw_tag = match.end(), None
+
+            match = self.OPEN_RE.search(buffer, position)
+            if not match:
+                # keep possible start of a tag like "<scr"
+                return max(position, len(buffer) - len("<script"))
+
+            if match.group(0) == "<!--":
+                position, self._raw_tag = match.end(), "!--"
+                continue
+
+            if match.group(1):
+                position, self._raw_tag = match.end(), match.group(1).lower()
+                continue
+
+            attributes_match = self.ATTRIBUTES_RE.match(buffer, match.end())
+            if not attributes_match:
+                if len(buffer) - match.start() > self.MAX_TAG_LENGTH:
+                    position = match.end()
+                    continue
+                return match.start()
+
+            position = attributes_match.end()
+            self.__addAnchor(AnchorScanLinkExtractor.parseAttributes(attributes_match.group(1)))
+        return position
+
+    def __addAnchor(self, attributes: dict[str, str]):
+        classes = attributes.get('class', '').split()
+        link = None
+        if MAIN_APP_CLASS in classes and self.main is None:
+            link = self.main = urljoin(self.url, attributes['href'])
+        if APP_CLASS in classes:
+            link = urljoin(self.url, attributes['href'])
+            self.apps.append(link)
+
+        if link and self._pending is not None:
+            self._pending.discard(package_id_from_link(link))
+            self.is_complete = not self._pending
+
+
+LINK_EXTRACTORS: dict[str, type[LinkExtractor]] = {
+    BeautifulSoupLinkExtractor.name: BeautifulSoupLinkExtractor,
+    LxmlLinkExtractor.name: LxmlLinkExtractor,
+    AnchorScanLinkExtractor.name: AnchorScanLinkExtractor,
+}
+
+
+@lru_cache
+def get_link_extractor(name: str) -> LinkExtractor:
+    """ Returns link extractor by its `name`.
+
+    Args:
+        name (str): one of `LINK_EXTRACTORS` keys
+
+    Raises:
+        ImproperlyConfigured: extractor is unknown or its dependencies are not installed
+
+    Returns:
+        LinkExtractor: extractor instance, shared between threads
+    """
+    if name not in LINK_EXTRACTORS:
+        raise ImproperlyConfigured(
+            f"Unknown link extractor {name}! LINK_EXTRACTOR must be one of {', '.join(LINK_EXTRACTORS)}.")
+
+    return LINK_EXTRACTORS[name]()
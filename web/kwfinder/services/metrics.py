@@ -0,0 +1,277 @@
+import logging
+import os
+import socket
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, perf_counter, time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def worker_name() -> str:
+    """ Returns name of the current process, that is unique across hosts """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels.keys(), escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """ Metric family of the Prometheus text format with its label values """
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self, constant_labels: dict[str, str]) -> list[tuple[str, dict[str, str], float]]:
+        """ Returns (sample name, labels, value) of every label values """
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, {**constant_labels, **dict(zip(self.labelnames, key))}, value) for key, value in values]
+
+    def render(self, constant_labels: dict[str, str]) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines += [f"{name}{_format_labels(labels)} {_format_value(value)}"
+                  for name, labels, value in self.samples(constant_labels)]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """ Returns sum of the counter over all label values """
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """ Observes run time of the `with` block """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def samples(self, constant_labels: dict[str, str]) -> list[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+        for key, counts, total in values:
+            labels = {**constant_labels, **dict(zip(self.labelnames, key))}
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """ Metrics of the process. Every sample gets `worker` label with the process name. """
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.__register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.__register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """ Returns metrics in Prometheus text format """
+        constant_labels = {"worker": worker_name()}
+        return "\n".join(metric.render(constant_labels) for metric in self.metrics) + "\n"
+
+    def __register(self, metric: Metric):
+        self.metrics.append(metric)
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "kwfinder_request_duration_seconds", "Store search request time by result (ok, not_found, throttled, error)",
+    ("region", "result"))
+PARSE_DURATION = REGISTRY.histogram(
+    "kwfinder_parse_duration_seconds", "Store search page parsing time",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+DB_WRITE_DURATION = REGISTRY.histogram(
+    "kwfinder_db_write_duration_seconds", "Position rows batch write time")
+KEYWORDS_PROCESSED = REGISTRY.counter(
+    "kwfinder_keywords_processed_total", "Keywords processed by scraper by result (done, failed)",
+    ("region", "result"))
+LINKS_NOT_FOUND = REGISTRY.counter(
+    "kwfinder_links_not_found_total", "Store searches without any links", ("region",))
+KEYWORD_RETRIES = REGISTRY.counter(
+    "kwfinder_keyword_retries_total", "Keywords put back to the queue after an error", ("region",))
+PROXY_ERRORS = REGISTRY.counter(
+    "kwfinder_proxy_errors_total", "Failed requests and block signals by proxy and reason (failed, blocked)",
+    ("proxy", "reason"))
+SERP_BYTES = REGISTRY.counter(
+    "kwfinder_serp_bytes_total", "Bytes of store search pages read from the network by mode (full, streamed)",
+    ("mode",))
+SERP_PAGES = REGISTRY.counter(
+    "kwfinder_serp_pages_total", "Store search pages read by mode (full, streamed)", ("mode",))
+SERP_BYTES_SKIPPED = REGISTRY.counter(
+    "kwfinder_serp_bytes_skipped_total", "Bytes of streamed search pages, that were not read (by Content-Length)")
+JOB_ITEMS = REGISTRY.counter(
+    "kwfinder_job_items_total", "Items processed by job by result", ("job", "result"))
+JOB_DURATION = REGISTRY.gauge(
+    "kwfinder_job_duration_seconds", "Run time of the last job run (so far, while it runs)", ("job",))
+JOB_LAST_SUCCESS = REGISTRY.gauge(
+    "kwfinder_job_last_success_timestamp_seconds", "Unix time of the last successful job run end", ("job",))
+
+
+class SerpTraffic:
+    """ Store search pages traffic of the process since the object is created """
+
+    def __init__(self) -> None:
+        self._bytes = SERP_BYTES.total()
+        self._pages = SERP_PAGES.total()
+        self._skipped = SERP_BYTES_SKIPPED.total()
+
+    def summary(self, keywords: int) -> str:
+        """ Returns human readable traffic for `keywords` processed keywords """
+        traffic = SERP_BYTES.total() - self._bytes
+        pages = SERP_PAGES.total() - self._pages
+        skipped = SERP_BYTES_SKIPPED.total() - self._skipped
+        return (
+            f"SERP traffic: {traffic / 1024:.0f} KiB in {pages:.0f} pages, "
+            f"{traffic / max(keywords, 1) / 1024:.1f} KiB per keyword"
+            + (f", {skipped / 1024:.0f} KiB not read by streaming" if skipped else ""))
+
+
+def write_textfile(job: str):
+    """ Writes metrics of the process to `settings.METRICS_DIR` for the textfile collector
+    (and the `metrics/` endpoint). Files of the processes, that were not updated
+    in the last `settings.METRICS_TEXTFILE_TTL` seconds, are removed. """
+    if not settings.METRICS_DIR:
+        return
+
+    directory = Path(settings.METRICS_DIR)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{job}-{worker_name().replace(':', '-')}.prom"
+        temp_path = path.with_suffix(".prom.tmp")
+        temp_path.write_text(REGISTRY.render(), encoding="utf-8")
+        os.replace(temp_path, path)
+
+        for old_path in directory.glob("*.prom"):
+            if time() - old_path.stat().st_mtime > settings.METRICS_TEXTFILE_TTL:
+                old_path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Can't write metrics to {directory}: {e}")
+
+
+def read_textfiles() -> str:
+    """ Returns metrics of all processes from `settings.METRICS_DIR` in Prometheus text format.
+    Samples of the same metric from different files are grouped under one HELP and TYPE. """
+    families: dict[str, list[str]] = {}
+    if not settings.METRICS_DIR:
+        return ""
+
+    for path in sorted(Path(settings.METRICS_DIR).glob("*.prom")):
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+
+        family = None
+        for line in lines:
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split()[2]
+                if family not in families:
+                    families[family] = []
+                if line not in families[family]:
+                    families[family].append(line)
+            elif line and family is not None:
+                families[family].append(line)
+
+    return "".join("\n".join(lines) + "\n" for lines in families.values())
+
+
+@contextmanager
+def job_metrics(job: str):
+    """ Measures run time of the job and writes metrics of the process to the textfile
+    every `settings.METRICS_FLUSH_INTERVAL` seconds while the job runs and once it ends """
+    started = monotonic()
+    stopped = threading.Event()
+
+    def flush():
+        while not stopped.wait(settings.METRICS_FLUSH_INTERVAL):
+            JOB_DURATION.set(monotonic() - started, job=job)
+            write_textfile(job)
+
+    flusher = threading.Thread(target=flush, name=f"{job}-metrics", daemon=True)
+    flusher.start()
+    try:
+        yield
+        JOB_LAST_SUCCESS.set(time(), job=job)
+    finally:
+        stopped.set()
+        flusher.join()
+        JOB_DURATION.set(monotonic() - started, job=job)
+        write_textfile(job)
@@ -0,0 +1,113 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+from typing import List
+
+from django.conf import settings
+
+from . import metrics
+from .link_extractors import get_link_extractor
+
+logger = logging.getLogger(__name__)
+
+SHARED_MEMORY_MIN_SIZE = 64 * 1024  # smaller pages are cheaper to pickle
+
+
+def _parse_page(content: bytes | None,
+                shared_memory_name: str | None,
+                size: int,
+                encoding: str,
+                status_code: int,
+                response_url: str,
+                url: str,
+                extractor_name: str) -> tuple[List[str], float]:
+    """ Parses page in the worker process. Page is passed as `content` or in the shared memory block. """
+    started = perf_counter()
+    if shared_memory_name:
+        # the block is unlinked by the parent process, workers only attach to it
+        shared_memory = SharedMemory(name=shared_memory_name)
+        try:
+            html = str(shared_memory.buf[:size], encoding, errors="replace")
+        finally:
+            shared_memory.close()
+    else:
+        html = content.decode(encoding, errors="replace")
+
+    # imported here, so the worker doesn't import requests stack before it is needed
+    from .googlePlayServicePlain import GooglePlayService
+    GooglePlayService.checkThrottled(status_code=status_code, url=response_url, html=html)
+
+    links = get_link_extractor(extractor_name).extract(html=html, url=url)
+    return links, perf_counter() - started
+
+
+def _warm_up() -> bool:
+    return True
+
+
+class ParsePool:
+    """ Parses store search pages in `processes` worker processes, so parsing is not limited by GIL
+    of the scraper threads. Pages bigger than `SHARED_MEMORY_MIN_SIZE` are handed over in a shared memory
+    block (one copy, no pickling of the page), smaller ones are pickled. Workers return link lists. """
+
+    def __init__(self, processes: int, extractor_name: str | None = None) -> None:
+        self.processes = processes
+        self.extractor_name = extractor_name or settings.LINK_EXTRACTOR
+        get_link_extractor(self.extractor_name)  # fails here, not in every worker, if it is misconfigured
+        # scraper threads are already running, so workers are spawned instead of forked
+        self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        for future in [self._executor.submit(_warm_up) for _ in range(processes)]:
+            future.result()
+        logger.info(f"Parse pool is started with {processes} processes.")
+
+    def parse(self, content: bytes, encoding: str | None, status_code: int, response_url: str, url: str) -> List[str]:
+        """ Checks page for throttling and parses it in a worker process. Blocks until the result is ready.
+
+        Args:
+            content (bytes): raw page content
+            encoding (str | None): page encoding. Defaults to utf-8.
+            status_code (int): response status code
+            response_url (str): response url (after redirects)
+            url (str): search page url, used to resolve relative links
+
+        Raises:
+            SearchThrottled: store responded with throttling status code or captcha page
+
+        Returns:
+            List[str]: links in the order they are shown in store
+        """
+        shared_memory = None
+        if len(content) >= SHARED_MEMORY_MIN_SIZE:
+            shared_memory = SharedMemory(create=True, size=len(content))
+            shared_memory.buf[:len(content)] = content
+
+        try:
+            future = self._executor.submit(
+                _parse_page,
+                content=None if shared_memory else content,
+                shared_memory_name=shared_memory.name if shared_memory else None,
+                size=len(content),
+                encoding=encoding or "utf-8",
+                status_code=status_code,
+                response_url=response_url,
+                url=url,
+                extractor_name=self.extractor_name)
+            links, parse_time = future.result()
+        finally:
+            if shared_memory:
+                shared_memory.close()
+                shared_memory.unlink()
+
+        metrics.PARSE_DURATION.observe(parse_time)
+        return links
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -74,8 +74,9 @@ class MobileProxy:
         
         time_since_last_change = datetime.now() - self.last_time_ip_changed
         if time_since_last_change < self.IP_CHANGE_TIMEOUT:
-            logger.info(f"Too little time since last ip change {time_since_last_change}. Sleeping.")
-            sleep(time_since_last_change.total_seconds())
+            time_left = self.IP_CHANGE_TIMEOUT - time_since_last_change
+            logger.info(f"Too little time since last ip change {time_since_last_change}. Sleeping for {time_left}.")
+            sleep(time_left.total_seconds())
         
         user_agent = "Mozilla/5.0 (iPad; U; CPU OS 3_2 like Mac OS X; en-us) AppleWebKit/531.21.10 (KHTML, like Gecko) Version/4.0.4 Mobile/7B334b Safari/531.21.102011-10-16 20:23:10"
         headers = {"User-Agent": user_agent}
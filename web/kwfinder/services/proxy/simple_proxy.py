@@ -1,13 +1,24 @@
 import logging
 import os
-from time import sleep
+import threading
+from time import monotonic, sleep
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 
+try:
+    import httpx
+except ImportError:  # httpx (with h2) is optional, it is needed only for HTTP/2 transport
+    httpx = None
+
 logger = logging.getLogger(__name__)
 
 MAX_ATTEMPTS = 3
+RETRY_DELAY = 2
+CONNECTION_ERRORS = (ConnectionError, httpx.TransportError) if httpx else (ConnectionError,)
 
 def get_proxy() -> dict[str, str] | None:
     proxy = os.getenv("PROXY")
@@ -20,42 +31,187 @@ def get_proxy() -> dict[str, str] | None:
         'https': proxy
     }
 
-def create_proxy_requests_session(proxy: dict[str, str], attempt: int = 1) -> Session | None:
-    """Create requests session with given proxy. Max tries for creation is defined in `MAX_ATTEMPTS` variable.
+def create_proxy_requests_session(proxy: dict[str, str], max_attempts: int = MAX_ATTEMPTS) -> Session | None:
+    """Create requests session with given proxy. Connection errors are retried after `RETRY_DELAY` seconds.
 
     Args:
         proxy (dict[str, str]): given proxy in requests format
-        attempt (int, optional): Current attempt num. Defaults to 1.
+        max_attempts (int, optional): Max tries for creation. Defaults to `MAX_ATTEMPTS`.
 
     Returns:
-        Session | None: Created session. None if can't create session in `MAX_ATTEMPTS` tries or can't find test url.
+        Session | None: Created session. None if can't create session in `max_attempts` tries or can't find test url.
     """
-    logger.info(f"Creating requests session for proxy {safe_proxy_repr(proxy)}. Attempt {attempt}.")
     proxy_test_url = os.getenv('PROXY_TEST_URL')
     if not proxy_test_url:
         logger.warning("Can't find proxy_test_url for proxy to create working session.")
         return
-    
-    if attempt > MAX_ATTEMPTS:
-        logger.error(f"Can't create working proxy session for proxy {safe_proxy_repr(proxy)} in {MAX_ATTEMPTS} tries!")
-        return
-    
+
+    for attempt in range(1, max_attempts + 1):
+        logger.info(f"Creating requests session for proxy {safe_proxy_repr(proxy)}. Attempt {attempt}.")
+        session = create_pooled_session(proxy=proxy)
+        try:
+            session.get(proxy_test_url, timeout=settings.TIMEOUT_TIME)
+        except CONNECTION_ERRORS:
+            session.close()
+            logger.warning(f"Connection error in creating session for proxy {safe_proxy_repr(proxy)} in attempt {attempt}.")
+            if attempt < max_attempts:
+                sleep(RETRY_DELAY)
+            continue
+        except Exception as e:
+            session.close()
+            logger.error(f"Unexpected error while creating session for proxy {safe_proxy_repr(proxy)}!")
+            logger.exception(e)
+            return
+
+        return session
+
+    if max_attempts > 1:
+        logger.error(f"Can't create working proxy session for proxy {safe_proxy_repr(proxy)} in {max_attempts} tries!")
+
+
+class Http2Session:
+    """Requests-like session over httpx client, that negotiates HTTP/2 with the store and multiplexes
+    concurrent requests of all threads over up to `settings.PROXY_POOL_SIZE` connections through the proxy.
+    Compressed transfer (gzip, deflate and br/zstd if their packages are installed) is negotiated by httpx.
+    Needs `httpx[http2]` package."""
+
+    def __init__(self, proxy: dict[str, str]) -> None:
+        if httpx is None:
+            raise ImproperlyConfigured("STORE_TRANSPORT=http2 needs httpx[http2] package, it is not installed!")
+        self.proxies = proxy
+        self._client = httpx.Client(
+            http2=True,
+            proxy=proxy.get('https') or proxy.get('http'),
+            follow_redirects=True,
+            timeout=settings.TIMEOUT_TIME,
+            limits=httpx.Limits(max_connections=settings.PROXY_POOL_SIZE,
+                                max_keepalive_connections=settings.PROXY_POOL_SIZE))
+
+    def get(self, url: str, timeout: float | None = None, stream: bool = False) -> "httpx.Response":
+        """Makes GET request. Body of the `stream` response is read by `iter_bytes`, response must be closed."""
+        request = self._client.build_request(
+            "GET", url, timeout=settings.TIMEOUT_TIME if timeout is None else timeout)
+        return self._client.send(request, stream=stream)
+
+    def close(self):
+        self._client.close()
+
+
+def create_pooled_session(proxy: dict[str, str]) -> Session | Http2Session:
+    """Creates session with given proxy, that keeps up to `settings.PROXY_POOL_SIZE`
+    keep-alive connections per host. It is requests session (HTTP/1.1) or
+    `Http2Session` if `settings.STORE_TRANSPORT` is "http2".
+
+    Args:
+        proxy (dict[str, str]): given proxy in requests format
+
+    Returns:
+        Session | Http2Session: session with connection pool
+    """
+    if settings.STORE_TRANSPORT == "http2":
+        return Http2Session(proxy=proxy)
+
     session = Session()
+    adapter = HTTPAdapter(pool_connections=settings.PROXY_POOL_SIZE,
+                          pool_maxsize=settings.PROXY_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
     session.proxies = proxy
-    try:
-        session.get(proxy_test_url)
-    except ConnectionError:
-        logger.warning(f"Connection error in creating session for proxy {safe_proxy_repr(proxy)} in attempt {attempt}.")
-        sleep(2)
-        return create_proxy_requests_session(proxy, attempt + 1)
-    except Exception as e:
-        logger.error(f"Unexpected error while creating session for proxy {safe_proxy_repr(proxy)}!")
-        logger.exception(e)
-        return
-    
     return session
 
 
+class ProxySession:
+    """Keeps one pooled session for the proxy, so connections (and TLS handshakes through the proxy)
+    are reused between requests. Session is checked with `PROXY_TEST_URL` once in
+    `settings.PROXY_HEALTH_CHECK_INTERVAL` seconds and is recreated if it doesn't work."""
+
+    def __init__(self, proxy: dict[str, str], health_check_interval: float | None = None) -> None:
+        self.proxy = proxy
+        self.health_check_interval = settings.PROXY_HEALTH_CHECK_INTERVAL \
+            if health_check_interval is None else health_check_interval
+
+        self._session: Session | Http2Session | None = None
+        self._last_check = 0.0
+        self._checking = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Session | Http2Session | None:
+        """Returns working session for the proxy. Session creation is tried `MAX_ATTEMPTS` times,
+        other threads aren't blocked while it waits between the tries. Health check request is sent
+        without the lock, other threads keep using the session while it is checked.
+
+        Returns:
+            Session | Http2Session | None: session. None if can't create working session.
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            with self._lock:
+                session = self._session
+                if session and (self._checking or monotonic() - self._last_check < self.health_check_interval):
+                    return session
+
+                if session:
+                    self._checking = True
+
+            if session:
+                healthy = self.__isHealthy(session)
+                with self._lock:
+                    self._checking = False
+                    if self._session is not session:
+                        # session was reset meanwhile, the next iteration uses the new one
+                        continue
+
+                    self._last_check = monotonic()
+                    if healthy:
+                        return session
+
+                    self.__close()
+
+            with self._lock:
+                if self._session:
+                    # other thread has created the session meanwhile
+                    return self._session
+
+                # threads wait for the new session, they have nothing to use without it
+                if os.getenv('PROXY_TEST_URL'):
+                    self._session = create_proxy_requests_session(proxy=self.proxy, max_attempts=1)
+                else:
+                    self._session = create_pooled_session(proxy=self.proxy)
+
+                self._last_check = monotonic()
+                if self._session:
+                    return self._session
+
+            if attempt < MAX_ATTEMPTS:
+                sleep(RETRY_DELAY)
+
+        logger.error(f"Can't create working proxy session for proxy {safe_proxy_repr(self.proxy)} in {MAX_ATTEMPTS} tries!")
+        return None
+
+    def reset(self):
+        """Closes current session. New one is created on next `get` call"""
+        with self._lock:
+            self.__close()
+
+    def __close(self):
+        if self._session:
+            self._session.close()
+        self._session = None
+
+    def __isHealthy(self, session: Session | Http2Session) -> bool:
+        proxy_test_url = os.getenv('PROXY_TEST_URL')
+        if not proxy_test_url:
+            return True
+
+        try:
+            session.get(proxy_test_url, timeout=settings.TIMEOUT_TIME)
+        except Exception as e:
+            logger.warning(
+                f"Health check failed for proxy {safe_proxy_repr(self.proxy)}: {e}")
+            return False
+
+        return True
+
+
 def safe_proxy_repr(proxies: dict[str, str]) -> str:
     if 'http' in proxies:
         proxy = proxies['http']
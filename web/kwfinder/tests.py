@@ -1,3 +1,304 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from src import keywords
+from src.job_queue import RunJobQueue
+from src.position_store import position_counts
+from src.position_writer import PositionWriter
+from src.run_plan import KeywordPlan
+from src.serp_snapshots import NOT_APP, unpack_ids
+from web.kwfinder import models
+from web.kwfinder.services.link_extractors import (LINK_EXTRACTORS,
+                                                   BeautifulSoupLinkExtractor,
+                                                   LxmlLinkExtractor,
+                                                   StreamingLinkScanner, lxml)
+
+SERP_PAGES_DIR = Path(settings.BASE_DIR) / "resources" / "serp_pages"
+SEARCH_URL = "https://play.google.com/store/search?q=test&c=apps"
+
+# markup variants, that extractors must handle as bs4 does
+PAGES = {
+    "plain": (
+        '<html><body><a class="Qfxief" href="/store/apps/details?id=com.main">main</a>'
+        '<div><a class="Gy4nib" href="/store/apps/details?id=com.one&amp;hl=en">one</a></div>'
+        '<div><a class="Gy4nib" href="https://play.google.com/store/apps/details?id=com.two">two</a></div>'
+        '</body></html>'),
+    "attributes": (
+        "<A HREF='/store/apps/details?id=com.one' class='x Gy4nib y'>one</A>"
+        '<a data-title="a > b" class="Gy4nib" href="/store/apps/details?id=com.two">two</a>'
+        '<a class=Gy4nib href=/store/apps/details?id=com.three>three</a>'
+        '<a class="Qfxief" href="/store/apps/details?id=com.main">main</a>'),
+    "hidden": (
+        '<!-- <a class="Gy4nib" href="/store/apps/details?id=com.comment">x</a> -->'
+        '<script>var a = \'<a class="Gy4nib" href="/store/apps/details?id=com.script">\';</script>'
+        '<style>.Gy4nib { color: red }</style>'
+        '<a class="Gy4nib" href="/store/apps/details?id=com.one">one</a>'),
+    "no apps": '<html><body><a href="/store/apps">apps</a><p>Nothing is found</p></body></html>',
+    "empty": '',
+}
+
+
+def recorded_pages() -> dict[str, str]:
+    """ Returns search pages recorded with `record_serp_fixtures` by file name """
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(SERP_PAGES_DIR.glob("*.html"))}
+
+
+class MaxRepeatedPositionOrAvgTest(SimpleTestCase):
+    def setUp(self):
+        self.policy = getattr(keywords, "__getMaxRepeatedPositionOrAvg")
+
+    def test_no_positions(self):
+        self.assertEqual(self.policy(Counter()), 0)
+
+    def test_single_position(self):
+        self.assertEqual(self.policy(Counter({7: 1})), 7)
+        self.assertEqual(self.policy(Counter({0: 1})), 0)
+
+    def test_average_ignores_zeros(self):
+        self.assertEqual(self.policy(Counter({0: 1, 4: 1, 7: 1})), 5)
+        self.assertEqual(self.policy(Counter({3: 1, 4: 1})), 3)
+
+    def test_most_repeated(self):
+        self.assertEqual(self.policy(Counter({9: 2, 1: 1})), 9)
+        self.assertEqual(self.policy(Counter({0: 3, 2: 1, 5: 2})), 0)
+
+    def test_tie_takes_lowest_position(self):
+        self.assertEqual(self.policy(Counter({8: 2, 3: 2, 1: 1})), 3)
+        self.assertEqual(self.policy(Counter({4: 2, 0: 2})), 0)
+
+
+class PositionsTestMixin:
+    """ Creates two apps and two keywords: the first app tracks both keywords, the second one - the first keyword """
+
+    def createApps(self):
+        region = models.ASOWorldRegion.objects.create(
+            code="us", name="USA", is_app_store_supported=True, is_google_play_supported=True,
+            google_store_link_attributes="&gl=us")
+        platform = models.AppPlatform.objects.create(name="Android", base_store_link="https://play.google.com")
+        self.first_app, self.second_app = [
+            models.App.objects.create(
+                name=f"App {num}", package_id=f"com.app{num}", platform=platform, region=region,
+                num=str(num), campaign_id=str(num))
+            for num in (1, 2)
+        ]
+        self.first_keyword, self.second_keyword = [
+            models.Keyword.objects.create(name=name, region=region) for name in ("first", "second")]
+        self.first_app.keywords.add(self.first_keyword, self.second_keyword)
+        self.second_app.keywords.add(self.first_keyword)
+
+    @staticmethod
+    def createRun(started_at: datetime) -> models.AppPositionScriptRun:
+        run = models.AppPositionScriptRun.objects.create()
+        models.AppPositionScriptRun.objects.filter(id=run.id).update(started_at=started_at)
+        run.refresh_from_db()
+        return run
+
+    @staticmethod
+    def createPositions(run: models.AppPositionScriptRun, keyword: models.Keyword, positions: dict):
+        models.AppPositionScriptRunData.objects.bulk_create([
+            models.AppPositionScriptRunData(run=run, keyword=keyword, app=app, position=position)
+            for app, position in positions.items()
+        ])
+
+
+class MergeKeywordStatsForDaysTest(PositionsTestMixin, TestCase):
+    DAY = "2024-01-10"
+
+    def setUp(self):
+        self.createApps()
+        day = timezone.make_aware(datetime(2024, 1, 10))
+        self.runs = [self.createRun(day + timedelta(hours=hour)) for hour in (8, 12, 16)]
+        self.createPositions(self.runs[0], self.first_keyword, {self.first_app: 3, self.second_app: 4})
+        self.createPositions(self.runs[1], self.first_keyword, {self.first_app: 3, self.second_app: 6})
+        # sparse run: the second app was checked, but not found, so its row is not stored
+        self.createPositions(self.runs[2], self.first_keyword, {self.first_app: 5})
+        models.AppPositionScriptRunTask.objects.create(
+            run=self.runs[2], keyword=self.first_keyword, state=models.AppPositionScriptRunTask.DONE,
+            checked_app_ids=[self.first_app.id, self.second_app.id])
+        # runs of other days are not merged
+        self.createPositions(self.createRun(day + timedelta(days=1)), self.first_keyword, {self.first_app: 50})
+
+    def merged(self) -> dict[tuple[int, int], int]:
+        return {
+            (keyword_id, app_id): position
+            for keyword_id, app_id, position in models.DailyAggregatedPositionData.objects.filter(
+                date=self.DAY).values_list("keyword_id", "app_id", "position")
+        }
+
+    def test_merge(self):
+        keywords.mergeKeywordStatsForDays(self.DAY)
+
+        self.assertEqual(self.merged(), {
+            (self.first_keyword.id, self.first_app.id): 3,
+            (self.first_keyword.id, self.second_app.id): 5,
+        })
+
+    def test_pairs_without_positions_are_kept(self):
+        models.DailyAggregatedPositionData.objects.create(
+            date=self.DAY, keyword=self.second_keyword, app=self.first_app, position=9)
+
+        keywords.mergeKeywordStatsForDays(self.DAY)
+
+        self.assertEqual(self.merged()[(self.second_keyword.id, self.first_app.id)], 9)
+
+    def test_merge_again_writes_changed_rows(self):
+        keywords.mergeKeywordStatsForDays(self.DAY)
+        with self.assertLogs("src.keywords", level="INFO") as logs:
+            keywords.mergeKeywordStatsForDays(self.DAY)
+        self.assertIn("0 instances created, 0 updated, 2 are not changed", logs.output[-1])
+
+        models.AppPositionScriptRunData.objects.filter(
+            run=self.runs[0], app=self.second_app).update(position=6)
+        with self.assertLogs("src.keywords", level="INFO") as logs:
+            keywords.mergeKeywordStatsForDays(self.DAY)
+        self.assertIn("0 instances created, 1 updated, 1 are not changed", logs.output[-1])
+        self.assertEqual(self.merged()[(self.first_keyword.id, self.second_app.id)], 6)
+
+
+class LinkExtractorsParityTest(SimpleTestCase):
+    """ All extractors and the streaming scanner must return the same links as bs4 """
+
+    def assertParity(self, pages: dict[str, str]):
+        reference = BeautifulSoupLinkExtractor()
+        for name, extractor_class in LINK_EXTRACTORS.items():
+            if extractor_class is LxmlLinkExtractor and not lxml:
+                continue
+
+            extractor = extractor_class()
+            for page_name, html in pages.items():
+                with self.subTest(extractor=name, page=page_name):
+                    self.assertEqual(extractor.extract(html=html, url=SEARCH_URL),
+                                     reference.extract(html=html, url=SEARCH_URL))
+
+        for page_name, html in pages.items():
+            with self.subTest(extractor="streaming", page=page_name):
+                scanner = StreamingLinkScanner(url=SEARCH_URL)
+                for start in range(0, len(html), 7):
+                    scanner.feed(html[start:start + 7])
+                scanner.feed("")
+                self.assertEqual(scanner.links, reference.extract(html=html, url=SEARCH_URL))
+
+    def test_markup_variants(self):
+        self.assertParity(PAGES)
+
+    def test_recorded_pages(self):
+        pages = recorded_pages()
+        if not pages:
+            self.skipTest(f"No recorded search pages in {SERP_PAGES_DIR}. Record them with record_serp_fixtures.")
+        self.assertParity(pages)
+
+
+class RunJobQueueTest(PositionsTestMixin, TestCase):
+    def setUp(self):
+        self.createApps()
+        region = self.first_keyword.region
+        self.keywords = [self.first_keyword, self.second_keyword] + [
+            models.Keyword.objects.create(name=f"keyword {num}", region=region) for num in range(3)]
+        self.run = models.AppPositionScriptRun.objects.create()
+        models.AppPositionScriptRunTask.objects.bulk_create([
+            models.AppPositionScriptRunTask(run=self.run, keyword=keyword) for keyword in self.keywords])
+        self.plan = tuple(
+            KeywordPlan(keyword_id=keyword.id, query=keyword.name, region_code=region.code,
+                        store_attributes=region.google_store_link_attributes, apps=(), base_url=SEARCH_URL)
+            for keyword in self.keywords)
+
+    def queue(self, worker: str, plan: tuple[KeywordPlan, ...] | None = None, batch_size: int = 2) -> RunJobQueue:
+        return RunJobQueue(run=self.run, plan=self.plan if plan is None else plan, worker=worker,
+                           batch_size=batch_size, claim_timeout=60, poll_interval=0)
+
+    def claimed(self, worker: str) -> set[int]:
+        return set(models.AppPositionScriptRunTask.objects.filter(
+            run=self.run, claimed_by=worker).values_list("keyword_id", flat=True))
+
+    def test_workers_claim_different_tasks(self):
+        first = self.queue("first").get()
+        second = self.queue("second").get()
+
+        self.assertEqual(len(self.claimed("first")), 2)
+        self.assertEqual(len(self.claimed("second")), 2)
+        self.assertFalse(self.claimed("first") & self.claimed("second"))
+        self.assertIn(first.keyword.keyword_id, self.claimed("first"))
+        self.assertIn(second.keyword.keyword_id, self.claimed("second"))
+
+    def test_release(self):
+        queue = self.queue("first")
+        queue.get()
+
+        self.assertEqual(queue.release(), 2)
+        self.assertFalse(self.claimed("first"))
+
+    def test_expired_claims_are_taken(self):
+        self.queue("first").get()
+        self.queue("second").get()
+        models.AppPositionScriptRunTask.objects.filter(run=self.run, claimed_by="second").update(
+            claimed_at=timezone.now() - timedelta(seconds=120))
+
+        self.queue("third", batch_size=5).get()
+
+        self.assertEqual(len(self.claimed("first")), 2)
+        self.assertFalse(self.claimed("second"))
+        self.assertEqual(len(self.claimed("third")), 3)
+
+    def test_tasks_not_in_plan_are_failed(self):
+        queue = self.queue("first", plan=self.plan[1:], batch_size=5)
+
+        self.assertNotEqual(queue.get().keyword.keyword_id, self.first_keyword.id)
+        task = models.AppPositionScriptRunTask.objects.get(run=self.run, keyword=self.first_keyword)
+        self.assertEqual(task.state, models.AppPositionScriptRunTask.FAILED)
+
+
+class PositionWriterTest(PositionsTestMixin, TransactionTestCase):
+    """ Writer saves rows in its own thread, so its transactions must be visible to the test """
+
+    def setUp(self):
+        self.createApps()
+        self.run = models.AppPositionScriptRun.objects.create()
+        models.AppPositionScriptRunTask.objects.create(run=self.run, keyword=self.first_keyword)
+
+    def write(self, sparse: bool, snapshot: list[str] | None = None):
+        rows = [
+            models.AppPositionScriptRunData(
+                run_id=self.run.id, keyword_id=self.first_keyword.id, app_id=app.id, position=position)
+            for app, position in ((self.first_app, 3), (self.second_app, 0))
+        ]
+        with PositionWriter(run_id=self.run.id, sparse=sparse, flush_interval=0.1) as writer:
+            writer.add(rows, keyword_id=self.first_keyword.id, snapshot=snapshot)
+
+    def test_dense(self):
+        self.write(sparse=False)
+
+        stored = models.AppPositionScriptRunData.objects.filter(run=self.run)
+        self.assertEqual(dict(stored.values_list("app_id", "position")), {
+            self.first_app.id: 3, self.second_app.id: 0})
+        task = models.AppPositionScriptRunTask.objects.get(run=self.run)
+        self.assertEqual(task.state, models.AppPositionScriptRunTask.DONE)
+        self.assertIsNone(task.checked_app_ids)
+
+    def test_sparse(self):
+        self.write(sparse=True)
+
+        stored = models.AppPositionScriptRunData.objects.filter(run=self.run)
+        self.assertEqual(dict(stored.values_list("app_id", "position")), {self.first_app.id: 3})
+        task = models.AppPositionScriptRunTask.objects.get(run=self.run)
+        self.assertEqual(task.state, models.AppPositionScriptRunTask.DONE)
+        self.assertEqual(task.checked_app_ids, [self.first_app.id, self.second_app.id])
+
+        counts = position_counts(data=stored, tasks=models.AppPositionScriptRunTask.objects.filter(run=self.run))
+        self.assertEqual(counts, {
+            (self.first_keyword.id, self.first_app.id): Counter({3: 1}),
+            (self.first_keyword.id, self.second_app.id): Counter({0: 1}),
+        })
+
+    def test_snapshot(self):
+        self.write(sparse=True, snapshot=["com.app1", "", "com.other"])
+
+        snapshot = models.SerpSnapshot.objects.get(run=self.run, keyword=self.first_keyword)
+        packages = dict(models.StorePackage.objects.values_list("id", "package_id"))
+        self.assertEqual([packages.get(id, "") for id in unpack_ids(snapshot.package_ids)],
+                         ["com.app1", "", "com.other"])
+        self.assertEqual(unpack_ids(snapshot.package_ids)[1], NOT_APP)
@@ -19,6 +19,7 @@ router.register("asoworld_data", views.ASOWorldOrderKeywordDataView, basename="a
 urlpatterns = [
     path("", views.dailyAnalytics, name="analytics"),
     path("groups_analytics/", views.groupsAnalytics, name="groups_analytics"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
     #     path('console_data_api/',
     #          views.ConsoleDataApiView.as_view(),
     #          name='console_data_api')
@@ -1,6 +1,7 @@
 import logging
 
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
@@ -12,10 +13,12 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from src.position_store import has_sparse_tasks, with_missing_positions
 from web.apps.permissions import get_allowed_apps
 
 from . import models, serializers
 from .authentication import TokenAuthSupportQueryString
+from .services import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -297,6 +300,58 @@ class AppPositionScriptRunDataView(ReadOnlyModelViewSet):
             queryset = queryset.filter(run__started_at__gte=f"{date} 00:00:00", run__started_at__lte=f"{date} 23:59:59")
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """ Rows of the runs, that stored only found apps (see `SPARSE_POSITIONS`), are completed with zero
+        positions of the checked apps. Such rows have no id. Completed rows are sorted and paginated in memory,
+        so requests of such runs must be filtered by `keyword__id` or `app__id`. """
+        tasks = self.__getTasks()
+        if not has_sparse_tasks(tasks):
+            return super().list(request, *args, **kwargs)
+
+        if not self.__isNarrowed():
+            return Response(
+                {"error": "keyword__id or app__id filter is required for runs, that store only found apps"},
+                status=400)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = with_missing_positions(data=queryset, tasks=tasks, app_ids=self.__getAppIds())
+
+        ordering = filters.OrderingFilter().get_ordering(request, queryset, self) or []
+        rows.sort(key=lambda row: (row.run.started_at, row.keyword_id, row.app_id),
+                  reverse="-run__started_at" in ordering)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(rows, many=True)
+        return Response(serializer.data)
+
+    def __isNarrowed(self) -> bool:
+        """ Checks if the request is filtered by keyword or app """
+        return any(self.request.GET.get(name, "").isdigit() for name in ("keyword__id", "app__id"))
+
+    def __getTasks(self):
+        """ Returns keyword tasks of the runs and keywords, that are requested """
+        tasks = models.AppPositionScriptRunTask.objects.all()
+        keyword_id = self.request.GET.get("keyword__id")
+        if keyword_id and keyword_id.isdigit():
+            tasks = tasks.filter(keyword_id=int(keyword_id))
+
+        date = self.request.GET.get("date")
+        if date:
+            tasks = tasks.filter(run__started_at__gte=f"{date} 00:00:00", run__started_at__lte=f"{date} 23:59:59")
+        return tasks
+
+    def __getAppIds(self) -> set[int]:
+        """ Returns ids of the apps, that are requested and allowed to the user """
+        apps = get_allowed_apps(self.request)
+        app_id = self.request.GET.get("app__id")
+        if app_id and app_id.isdigit():
+            apps = apps.filter(id=int(app_id))
+        return set(apps.values_list("id", flat=True))
+
 
 class KeitaroDailyAppDataView(ReadOnlyModelViewSet):
     queryset = models.KeitaroDailyAppData.objects.all()
@@ -450,6 +505,22 @@ class ConsoleDataApiView(APIView):
         return response
 
 
+class MetricsView(APIView):
+    """View that exposes metrics of scraping and sync jobs (see `services.metrics`)
+    in Prometheus text format"""
+
+    authentication_classes = [
+        SessionAuthentication,
+        TokenAuthSupportQueryString,
+    ]
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request) -> HttpResponse:
+        return HttpResponse(metrics.read_textfiles(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @login_required
 def dailyAnalytics(request):
     """View for showing daily analytics page"""